@@ -1,7 +1,10 @@
 # app/__init__.py
 from flask import Flask
 from .config import Config
-from .db import init_db
+from .db import init_db, init_app as init_db_app
+from .cache import init_app as init_cache_app
+from .schema import init_app as init_schema
+from .cli import register_cli
 from .blueprints.auth import bp as auth_bp
 from .blueprints.admin_users import bp as admin_users_bp
 from .blueprints.admin_hospitals import bp as admin_hospitals_bp
@@ -10,6 +13,7 @@ from .blueprints.doctor_production import bp as doctor_production_bp
 from .blueprints.admin_productions import bp as admin_productions_bp
 from .blueprints.doctor_expenses import bp as doctor_expenses_bp
 from .blueprints.admin_expenses  import bp as admin_expenses_bp
+from .blueprints.admin_dashboard import bp as admin_dashboard_bp
 import os
 from datetime import datetime, date
 
@@ -17,7 +21,11 @@ def create_app():
     app = Flask(__name__, template_folder="templates")
     app.config.from_object(Config())
     os.makedirs(app.config["EXPENSES_UPLOAD_DIR"], exist_ok=True)
-    init_db(app.config["DB_CFG"])
+    init_db(app.config["DB_CFG"], app.config["DB_POOL"], app.config["DB_REPLICA_CFG"])
+    init_db_app(app)
+    init_schema(app)
+    init_cache_app(app)
+    register_cli(app)
 
     @app.context_processor
     def inject_globals():
@@ -72,4 +80,5 @@ def create_app():
     app.register_blueprint(admin_productions_bp, url_prefix="/admin")
     app.register_blueprint(doctor_expenses_bp, url_prefix="/doctor")
     app.register_blueprint(admin_expenses_bp,  url_prefix="/admin")
+    app.register_blueprint(admin_dashboard_bp, url_prefix="/admin")
     return app
@@ -0,0 +1,109 @@
+# app/blueprints/admin_dashboard.py
+from flask import Blueprint, request, session, abort, jsonify, make_response, current_app
+from hashlib import sha1
+from datetime import date
+
+from ..services.analytics_service import AnalyticsService
+from ..repositories.data_versions import DataVersionRepository
+from ..db import statement_timeout, pool_stats
+
+bp = Blueprint("admin_dashboard", __name__)
+analytics = AnalyticsService()
+versions = DataVersionRepository()
+
+# Painéis do dashboard do admin: cada um recorta o mesmo dashboard_data()
+# (em cache por filtros+versão, então os pedidos paralelos fazem 1 consulta).
+# "approx" vai junto: None quando os números são exatos.
+PANELS = {
+    "kpis": lambda d: {"totals": d["totals"], "approx": d["approx"]},
+    "top_doctors": lambda d: {"top_doctors": d["top_doctors"], "top_doctors_value": d["top_doctors_value"],
+                              "approx": d["approx"]},
+    "top_hospitals": lambda d: {"top_hospitals": d["top_hospitals"], "top_hospitals_value": d["top_hospitals_value"],
+                                "approx": d["approx"]},
+    # série por dia/semana/mês/trimestre + ano anterior (AnalyticsService.time_series)
+    "series": None,
+}
+
+
+def _admin_required() -> bool:
+    return bool(session.get("user_id")) and session.get("role") == "admin"
+
+
+@bp.before_request
+def guard():
+    if not _admin_required():
+        abort(403)
+
+
+def _filters() -> dict:
+    def _to_int(v: str | None):
+        return int(v) if v and v.isdigit() else None
+
+    return {
+        "date_from": request.args.get("date_from") or None,
+        "date_to": request.args.get("date_to") or None,
+        "hospital_id": _to_int(request.args.get("hospital_id")),
+        "doctor_user_id": _to_int(request.args.get("doctor_id")),
+        "procedure_id": _to_int(request.args.get("procedure_id")),
+    }
+
+
+def _conditional_json(datasets: tuple[str, ...], key, build):
+    """
+    Resposta JSON com ETag (versão dos dados + chave do painel) e
+    Last-Modified (última escrita nos dados). Se o navegador já tem essa
+    versão (If-None-Match / If-Modified-Since), devolve 304 sem consultar
+    nada além da tabela de versões.
+    """
+    tag, last_modified = versions.current(datasets)
+    # a data entra na chave: sem período, os painéis mostram o ano corrente
+    etag = sha1(repr((tag, key, date.today().isoformat())).encode()).hexdigest()[:32]
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        since = request.if_modified_since
+        not_modified = bool(since and last_modified and last_modified.replace(microsecond=0) <= since)
+
+    resp = make_response("", 304) if not_modified else jsonify(build(tag))
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    # sempre revalida: o 304 é barato e o dado nunca fica velho
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+@bp.route("/dashboard/panels/<name>.json")
+@statement_timeout(10_000)
+def panel(name: str):
+    if name not in PANELS:
+        abort(404)
+    extract = PANELS[name]
+    filters = _filters()
+    # ?estimate=1: resposta rápida por amostragem; a página pede a exata depois
+    estimate = request.args.get("estimate") == "1" and name != "series"
+
+    def build(tag: str):
+        if name == "series":
+            return analytics.time_series(**filters, version=tag)
+        rows = current_app.config["ANALYTICS_SAMPLE_ROWS"] if estimate else None
+        return extract(analytics.dashboard_data(**filters, version=tag, estimate_rows=rows))
+
+    return _conditional_json(
+        ("productions", "registry"), (name, estimate, tuple(sorted(filters.items()))), build
+    )
+
+
+@bp.route("/dashboard/filters.json")
+def filter_options():
+    return _conditional_json(("registry",), "filters", lambda tag: analytics.filter_options())
+
+
+@bp.route("/db/pool.json")
+def db_pool():
+    # retrato do pool deste worker (cada worker do gunicorn tem o seu)
+    resp = jsonify(pool_stats())
+    resp.cache_control.no_store = True
+    return resp
@@ -1,8 +1,9 @@
 # app/blueprints/admin_expenses.py
-from flask import Blueprint, render_template, request, session, abort, flash, redirect, url_for, send_from_directory, current_app
+from flask import Blueprint, request, session, abort, flash, redirect, url_for, send_from_directory, current_app
 import os
-from ..services.expenses_service import ExpensesService
-from ..db import get_conn
+from ..services.expenses_service import ExpensesService, ADMIN_LIST_LIMIT
+from ..db import get_conn, statement_timeout
+from ..streaming import stream_page, stream_csv, wants_gzip
 
 bp = Blueprint("admin_expenses", __name__)
 svc = ExpensesService()
@@ -32,6 +33,7 @@ def _list_doctors():
         return cur.fetchall()
 
 @bp.route("/expenses")
+@statement_timeout(15_000)
 def list_all():
     dfrom = request.args.get("f_date_from", "")
     dto   = request.args.get("f_date_to", "")
@@ -40,25 +42,47 @@ def list_all():
 
     doctor_id = int(f_doc) if f_doc.isdigit() else None
 
-    rows = svc.list_all(
+    filters = dict(
         date_from=dfrom or None,
         date_to=dto or None,
         city_like=city or None,
         doctor_user_id=doctor_id,  # <-- aplica filtro
     )
-
-    files_map = { r["id"]: svc.files_for_expense(r["id"]) for r in rows }
+    # linhas (com comprovantes) lidas enquanto a página é enviada
+    rows = svc.iter_all(**filters)
+    totals = svc.totals_all(**filters)
     doctors = _list_doctors()
 
-    return render_template(
+    return stream_page(
         "admin/expenses_list.html",
         rows=rows,
-        files_map=files_map,
+        totals=totals,
+        row_limit=ADMIN_LIST_LIMIT,
         doctors=doctors,          # <-- lista para o <select>
         f_date_from=dfrom, f_date_to=dto, f_city=city,
         f_doctor_id=f_doc,        # <-- mantém seleção
     )
 
+@bp.route("/expenses/export.csv")
+@statement_timeout(120_000)
+def export_csv():
+    """Despesas dos filtros f_* da listagem em CSV (COPY do Postgres, em partes)."""
+    dfrom = request.args.get("f_date_from", "")
+    dto   = request.args.get("f_date_to", "")
+    city  = request.args.get("f_city", "")
+    f_doc = request.args.get("f_doctor_id", "")
+
+    gzip = wants_gzip()
+    chunks = svc.export_csv(
+        date_from=dfrom or None,
+        date_to=dto or None,
+        city_like=city or None,
+        doctor_user_id=int(f_doc) if f_doc.isdigit() else None,
+        gzip=gzip,
+    )
+    fname = f"despesas_{dfrom or 'ini'}_a_{dto or 'fim'}.csv" if (dfrom or dto) else "despesas.csv"
+    return stream_csv(chunks, fname, gzip=gzip)
+
 @bp.route("/expenses/<int:expense_id>/delete", methods=["POST"])
 def delete_any(expense_id: int):
     ok = svc.delete_any(expense_id)
@@ -7,12 +7,19 @@ from ..repositories.productions import ProductionRepository
 from ..services.hospital_service import HospitalService
 from ..services.user_service import UserService
 from ..services.procedure_service import ProcedureService
+from ..services.analytics_service import AnalyticsService, PIVOT_LABELS, PIVOT_MEASURES
 from ..repositories.hospital_prices import HospitalPriceRepository
-from ..db import get_conn
+from ..repositories.production_rollup import ROLLUP_RETURNING
+from ..db import get_conn, statement_timeout
+from ..pagination import PAGE_SIZES, page_size, decode_cursor
+from ..streaming import stream_page, stream_csv, wants_gzip
 
 # --- Excel ---
 from io import BytesIO
+import tempfile
 from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 
 from datetime import datetime, date
@@ -23,6 +30,7 @@ repo = ProductionRepository()
 hsvc = HospitalService()
 usvc = UserService()
 psvc = ProcedureService()
+analytics = AnalyticsService()
 price_repo = HospitalPriceRepository()
 
 
@@ -126,6 +134,7 @@ def _find_procedure_id(cur, key: Optional[str]) -> Optional[int]:
 # Listagem
 # ---------------------------
 @bp.route("/productions", methods=["GET"])
+@statement_timeout(15_000)
 def list_all():
     doctor_id = request.args.get("doctor_id")
     hospital_id = request.args.get("hospital_id")
@@ -135,21 +144,32 @@ def list_all():
     did = int(doctor_id) if doctor_id and doctor_id.isdigit() else None
     hid = int(hospital_id) if hospital_id and hospital_id.isdigit() else None
 
-    rows = repo.list(
+    filters = dict(
         doctor_user_id=did,
         hospital_id=hid,
         date_from=date_from or None,
         date_to=date_to or None,
-        limit=10000
     )
+    # paginação por chave (exec_date, id): ?after=<cursor> / ?before=<cursor>
+    per_page = page_size(request.args.get("per_page"))
+    page = repo.page(
+        **filters,
+        after=decode_cursor(request.args.get("after")),
+        before=decode_cursor(request.args.get("before")),
+        per_page=per_page,
+        stream=True,  # linhas lidas enquanto a página é enviada
+    )
+    totals = repo.totals(**filters)
 
     hospitals = hsvc.list("")  # todos
     users = usvc.list_users()
     doctors = [u for u in users if u.get("role") == "doctor"]
 
-    return render_template(
+    return stream_page(
         "admin/productions_list.html",
-        rows=rows,
+        page=page,
+        totals=totals,
+        page_sizes=PAGE_SIZES,
         hospitals=hospitals,
         doctors=doctors,
         sel_doctor=did, sel_hospital=hid,
@@ -160,7 +180,23 @@ def list_all():
 # ---------------------------
 # Exportar Excel
 # ---------------------------
+# (cabeçalho, largura, formato numérico) das colunas da exportação: tudo
+# definido antes da primeira linha, porque a planilha é write-only
+EXPORT_COLUMNS = (
+    ("Data", 12, None),
+    ("Hospital", 30, None),
+    ("Médico", 30, None),
+    ("Código", 14, None),
+    ("Procedimento", 45, None),
+    ("Quantidade", 12, "0"),
+    ("Vlr Unit. (R$)", 16, "#,##0.00"),
+    ("Total (R$)", 16, "#,##0.00"),
+    ("Obs.", 40, None),
+)
+
+
 @bp.route("/productions/export.xlsx", methods=["GET"])
+@statement_timeout(120_000)
 def export_xlsx():
     doctor_id = request.args.get("doctor_id")
     hospital_id = request.args.get("hospital_id")
@@ -170,57 +206,65 @@ def export_xlsx():
     did = int(doctor_id) if doctor_id and doctor_id.isdigit() else None
     hid = int(hospital_id) if hospital_id and hospital_id.isdigit() else None
 
-    rows = repo.list(
+    # cursor server-side: as linhas vêm do banco em lotes, sem lista gigante em memória
+    rows = repo.iter_list(
         doctor_user_id=did,
         hospital_id=hid,
         date_from=date_from or None,
         date_to=date_to or None,
-        limit=100000
     )
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Produção"
-
-    header = [
-        "Data", "Hospital", "Médico", "Código", "Procedimento",
-        "Quantidade", "Vlr Unit. (R$)", "Total (R$)", "Obs."
-    ]
+    # write-only: cada linha vai direto para o arquivo (openpyxl não guarda
+    # as células), então a memória não cresce com o número de linhas
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Produção")
+    for idx, (_, width, _) in enumerate(EXPORT_COLUMNS, start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = width
+    ws.freeze_panes = "A2"
+
+    bold = Font(bold=True)
+    header = []
+    for title, _, _ in EXPORT_COLUMNS:
+        c = WriteOnlyCell(ws, value=title)
+        c.font = bold
+        header.append(c)
     ws.append(header)
 
-    for r in rows:
-        ws.append([
-            str(r.get("exec_date") or ""),
-            r.get("hospital_name") or "",
-            r.get("doctor_name") or r.get("username") or "",
-            r.get("tuss_code") or "",
-            r.get("procedure_name") or "",
-            r.get("quantity") or 0,
-            float(r.get("unit_price") or 0),
-            float(r.get("total") or 0),
-            r.get("note") or "",
-        ])
-
-    # formatos numéricos
-    for row in ws.iter_rows(min_row=2, min_col=6, max_col=8):
-        if row[0].value is not None:
-            row[0].number_format = "0"
-        if row[1].value is not None:
-            row[1].number_format = "#,##0.00"
-        if row[2].value is not None:
-            row[2].number_format = "#,##0.00"
-
-    # larguras
-    for idx, col_cells in enumerate(ws.iter_cols(min_col=1, max_col=ws.max_column), start=1):
-        max_len = 0
-        for cell in col_cells:
-            val = "" if cell.value is None else str(cell.value)
-            max_len = max(max_len, len(val))
-        ws.column_dimensions[get_column_letter(idx)].width = min(max(12, max_len + 2), 60)
+    formats = [fmt for _, _, fmt in EXPORT_COLUMNS]
 
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
+    def cells(values):
+        out = []
+        for value, fmt in zip(values, formats):
+            if fmt is None:
+                out.append(value)
+            else:
+                c = WriteOnlyCell(ws, value=value)
+                c.number_format = fmt
+                out.append(c)
+        return out
+
+    for r in rows:
+        ws.append(cells([
+            str(r.exec_date or ""),
+            r.hospital_name or "",
+            r.doctor_name or r.username or "",
+            r.tuss_code or "",
+            r.procedure_name or "",
+            r.quantity or 0,
+            float(r.unit_price or 0),
+            float(r.total or 0),
+            r.note or "",
+        ]))
+
+    # o .xlsx é um zip montado no save(): vai para um arquivo temporário
+    # (apagado ao fechar) e é enviado dele em blocos, sem BytesIO
+    tmp = tempfile.TemporaryFile(suffix=".xlsx")
+    try:
+        wb.save(tmp)
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
 
     if date_from or date_to:
         fname = f"producao_{date_from or 'ini'}_a_{date_to or 'fim'}.xlsx"
@@ -228,13 +272,135 @@ def export_xlsx():
         fname = "producao.xlsx"
 
     return send_file(
-        bio,
+        tmp,
         as_attachment=True,
         download_name=fname,
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
 
 
+
+@bp.route("/productions/export.csv", methods=["GET"])
+@statement_timeout(120_000)
+def export_csv():
+    """
+    Mesmos filtros do export_xlsx, em CSV gerado pelo COPY do Postgres e
+    enviado em partes enquanto é lido (?gzip=1 comprime a resposta).
+    """
+    doctor_id = request.args.get("doctor_id")
+    hospital_id = request.args.get("hospital_id")
+    date_from = request.args.get("date_from")
+    date_to   = request.args.get("date_to")
+
+    did = int(doctor_id) if doctor_id and doctor_id.isdigit() else None
+    hid = int(hospital_id) if hospital_id and hospital_id.isdigit() else None
+
+    gzip = wants_gzip()
+    chunks = repo.copy_csv(
+        doctor_user_id=did,
+        hospital_id=hid,
+        date_from=date_from or None,
+        date_to=date_to or None,
+        gzip=gzip,
+    )
+
+    if date_from or date_to:
+        fname = f"producao_{date_from or 'ini'}_a_{date_to or 'fim'}.csv"
+    else:
+        fname = "producao.csv"
+    return stream_csv(chunks, fname, gzip=gzip)
+
+# ---------------------------
+# Relatório dinâmico (pivot)
+# ---------------------------
+def _pivot_args() -> dict:
+    def _to_int(v: Optional[str]):
+        return int(v) if v and v.isdigit() else None
+
+    rows = request.args.get("rows") or "doctor"
+    cols = request.args.get("cols") or "procedure"
+    measure = request.args.get("measure") or "qty"
+    if rows not in PIVOT_LABELS or cols not in PIVOT_LABELS or rows == cols:
+        rows, cols = "doctor", "procedure"
+    if measure not in PIVOT_MEASURES:
+        measure = "qty"
+    return {
+        "rows": rows,
+        "cols": cols,
+        "measure": measure,
+        "date_from": _norm_date(request.args.get("date_from")),
+        "date_to": _norm_date(request.args.get("date_to")),
+        "hospital_id": _to_int(request.args.get("hospital_id")),
+        "doctor_user_id": _to_int(request.args.get("doctor_id")),
+        "procedure_id": _to_int(request.args.get("procedure_id")),
+    }
+
+
+@bp.route("/productions/pivot", methods=["GET"])
+@statement_timeout(30_000)
+def pivot():
+    args = _pivot_args()
+    report = analytics.pivot(**args)
+    opts = analytics.filter_options()
+
+    return render_template(
+        "admin/productions_pivot.html",
+        report=report,
+        args=args,
+        dimensions=PIVOT_LABELS,
+        measures=PIVOT_MEASURES,
+        hospitals=opts["hospitals"],
+        doctors=opts["doctors"],
+        procedures=opts["procedures"],
+    )
+
+
+@bp.route("/productions/pivot.xlsx", methods=["GET"])
+@statement_timeout(30_000)
+def pivot_xlsx():
+    args = _pivot_args()
+    report = analytics.pivot(**args)
+    money = args["measure"] == "value"
+    fmt = "#,##0.00" if money else "0"
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Relatório"
+
+    corner = f"{PIVOT_LABELS[args['rows']]} × {PIVOT_LABELS[args['cols']]}"
+    ws.append([corner] + [h["label"] for h in report["col_headers"]] + ["Total"])
+    for head, line, total in zip(report["row_headers"], report["matrix"], report["row_totals"]):
+        ws.append([head["label"]] + line + [total])
+    ws.append(["Total"] + report["col_totals"] + [report["total"]])
+
+    for row in ws.iter_rows(min_row=2, min_col=2):
+        for c in row:
+            c.number_format = fmt
+    for c in ws[1] + ws[ws.max_row]:
+        c.font = Font(bold=True)
+    ws.freeze_panes = "B2"
+
+    ws.column_dimensions["A"].width = min(max(
+        [len(corner)] + [len(h["label"]) for h in report["row_headers"]]
+    ) + 2, 60)
+    for idx, head in enumerate(report["col_headers"], start=2):
+        ws.column_dimensions[get_column_letter(idx)].width = min(max(12, len(head["label"]) + 2), 40)
+
+    bio = BytesIO()
+    wb.save(bio)
+    bio.seek(0)
+
+    fname = f"producao_{args['rows']}_x_{args['cols']}"
+    if args["date_from"] or args["date_to"]:
+        fname += f"_{args['date_from'] or 'ini'}_a_{args['date_to'] or 'fim'}"
+    return send_file(
+        bio,
+        as_attachment=True,
+        download_name=fname + ".xlsx",
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
 # ---------------------------
 # Download do Modelo (.xlsx)
 # ---------------------------
@@ -276,6 +442,7 @@ def download_template():
 # Importar Excel
 # ---------------------------
 @bp.post("/productions/import")
+@statement_timeout(60_000)
 def import_excel():
     file = request.files.get("file")
     if not file or not file.filename.lower().endswith((".xlsx", ".xlsm", ".xltx", ".xltm")):
@@ -313,6 +480,7 @@ def import_excel():
 
     ok_count = 0
     err_rows = []
+    inserted = []  # linhas para o production_rollup
 
     with get_conn() as conn, conn.cursor() as cur:
         for r in range(2, ws.max_row + 1):
@@ -368,20 +536,33 @@ def import_excel():
                 except Exception:
                     pass
 
+            # SAVEPOINT por linha: um INSERT que falha desfaz só a própria
+            # linha, e a transação segue válida para as demais e o rollup
+            cur.execute("SAVEPOINT imp;")
             try:
                 cur.execute(
-                    """
+                    f"""
                     INSERT INTO productions
                       (exec_date, doctor_user_id, hospital_id, procedure_id, quantity, unit_price, note)
                     VALUES
-                      (%s, %s, %s, %s, %s, NULLIF(%s,'')::numeric, NULLIF(%s,''));
+                      (%s, %s, %s, %s, %s, NULLIF(%s,'')::numeric, NULLIF(%s,''))
+                    RETURNING {ROLLUP_RETURNING};
                     """,
                     (exec_date, did, hid, pid, qty, unit_price or "", note or ""),
                 )
+                inserted.append(cur.fetchone())
+                cur.execute("RELEASE SAVEPOINT imp;")
                 ok_count += 1
             except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT imp;")
                 err_rows.append(f"L{r}: erro ao inserir ({e})")
 
+        # mesma transação dos INSERTs: rollup/resumos nunca ficam "meio importados"
+        repo.sync_aggregates(cur, inserted, sign=1)
+
+    if inserted:
+        repo.after_write()
+
     if ok_count:
         flash(f"Importação concluída: {ok_count} linha(s) inserida(s).", "ok")
     if err_rows:
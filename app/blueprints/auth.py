@@ -3,8 +3,7 @@ from flask import Blueprint, render_template, request, session, redirect, url_fo
 
 from ..services.user_service import UserService
 from ..services.analytics_service import AnalyticsService
-from ..services.hospital_service import HospitalService
-from ..services.procedure_service import ProcedureService
+from ..db import statement_timeout
 
 from datetime import datetime
 from datetime import timezone
@@ -14,9 +13,6 @@ bp = Blueprint("auth", __name__)
 # Serviços
 svc = UserService()
 analytics = AnalyticsService()
-hsvc = HospitalService()
-usvc = UserService()
-psvc = ProcedureService()
 
 
 @bp.route("/")
@@ -65,6 +61,7 @@ def privacy_internal():
 
 
 @bp.route("/dashboard")
+@statement_timeout(10_000)
 def dashboard():
     if not session.get("user_id"):
         return redirect(url_for("auth.login"))
@@ -73,49 +70,19 @@ def dashboard():
     user = session.get("username")
 
     if role == "admin":
-        # ---- Filtros vindos por GET (opcionais) ----
-        date_from = request.args.get("date_from") or ""
-        date_to = request.args.get("date_to") or ""
-
+        # Página leve: filtros e painéis chegam por JSON
+        # (admin_dashboard.panel / admin_dashboard.filter_options), em paralelo.
         def _to_int(v: str | None):
             return int(v) if v and v.isdigit() else None
 
-        sel_hospital = _to_int(request.args.get("hospital_id"))
-        sel_doctor = _to_int(request.args.get("doctor_id"))
-        sel_procedure = _to_int(request.args.get("procedure_id"))
-
-        # ---- Listas para os selects (preenchimento dos filtros) ----
-        hospitals = hsvc.list("")                      # todos os hospitais
-        users = usvc.list_users()                      # todos os usuários
-        doctors = [u for u in users if u.get("role") == "doctor"]
-        procedures = psvc.list(active=True)            # procedimentos ativos
-
-        # ---- Dados de analytics (com suporte a filtros, fallback se necessário) ----
-        try:
-            data = analytics.dashboard_data(
-                date_from=date_from or None,
-                date_to=date_to or None,
-                hospital_id=sel_hospital,
-                doctor_user_id=sel_doctor,
-                procedure_id=sel_procedure,
-            )
-        except TypeError:
-            # Caso sua AnalyticsService ainda não aceite filtros, usa sem argumentos
-            data = analytics.dashboard_data()
-
         return render_template(
             "admin/dashboard.html",
             user=user,
-            **data,
-            # contexto para os filtros
-            hospitals=hospitals,
-            doctors=doctors,
-            procedures=procedures,
-            sel_hospital=sel_hospital,
-            sel_doctor=sel_doctor,
-            sel_procedure=sel_procedure,
-            date_from=date_from,
-            date_to=date_to,
+            sel_hospital=_to_int(request.args.get("hospital_id")),
+            sel_doctor=_to_int(request.args.get("doctor_id")),
+            sel_procedure=_to_int(request.args.get("procedure_id")),
+            date_from=request.args.get("date_from") or "",
+            date_to=request.args.get("date_to") or "",
         )
 
     if role == "doctor":
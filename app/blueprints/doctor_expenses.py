@@ -1,14 +1,18 @@
 # app/blueprints/doctor_expenses.py
 from flask import (
-    Blueprint, render_template, request, session, abort, flash,
+    Blueprint, render_template, request, session, abort, flash, jsonify,
     redirect, url_for, current_app, send_from_directory
 )
 import os
 from ..services.expenses_service import ExpensesService
+from ..pagination import page_size, decode_cursor
+from ..filters import brdate
 
 bp = Blueprint("doctor_expenses", __name__)
 svc = ExpensesService()
 
+HISTORY_PAGE = 50  # solicitações por tela (o resto vem por rolagem)
+
 def _doctor_required() -> bool:
     return bool(session.get("user_id")) and session.get("role") == "doctor"
 
@@ -23,18 +27,41 @@ def form():
     dfrom = request.args.get("f_date_from", "")
     dto   = request.args.get("f_date_to", "")
     city  = request.args.get("f_city", "")
-    rows  = svc.list_mine(uid, dfrom or None, dto or None, city or None)
-
-    # carrega anexos de cada despesa
-    files_map = { r["id"]: svc.files_for_expense(r["id"]) for r in rows }
+    # só a primeira tela; o restante vem de history_json
+    page = svc.page_mine(uid, dfrom or None, dto or None, city or None, per_page=HISTORY_PAGE)
 
     return render_template(
         "doctor/expense_form.html",
-        rows=rows,
-        files_map=files_map,
+        rows=page.rows,
+        next_cursor=page.next_cursor,
         f_date_from=dfrom, f_date_to=dto, f_city=city
     )
 
+@bp.route("/expenses/history.json", methods=["GET"])
+def history_json():
+    """
+    Próxima página das solicitações (rolagem infinita): filtros f_* da
+    tela + ?cursor= (next_cursor da página anterior) e ?per_page=.
+    """
+    uid = session["user_id"]
+    page = svc.page_mine(
+        uid,
+        request.args.get("f_date_from") or None,
+        request.args.get("f_date_to") or None,
+        request.args.get("f_city") or None,
+        after=decode_cursor(request.args.get("cursor")),
+        per_page=page_size(request.args.get("per_page"), HISTORY_PAGE),
+    )
+    rows = [{
+        "id": r.id,
+        "request_date": r.request_date.isoformat(),
+        "request_date_br": brdate(r.request_date),
+        "city": r.city or "",
+        "amount": float(r.amount or 0),
+        "description": r.description or "",
+    } for r in page.rows]
+    return jsonify({"ok": True, "rows": rows, "next_cursor": page.next_cursor})
+
 @bp.route("/expenses/new", methods=["POST"])
 def submit():
     uid = session["user_id"]
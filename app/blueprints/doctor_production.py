@@ -2,11 +2,15 @@
 from flask import Blueprint, render_template, request, session, abort, jsonify, flash, redirect, url_for
 from ..services.production_service import ProductionService
 from ..services.hospital_service import HospitalService
+from ..pagination import page_size, decode_cursor
+from ..filters import brdate
 
 bp = Blueprint("doctor_production", __name__)
 svc = ProductionService()
 hsvc = HospitalService()
 
+HISTORY_PAGE = 50  # linhas do histórico por tela (o resto vem por rolagem)
+
 def _doctor_required():
     return bool(session.get("user_id")) and session.get("role") == "doctor"
 
@@ -33,18 +37,21 @@ def production_form():
     # lista de procedimentos para o combo de filtro (se houver hospital filtrado)
     filter_procedures = svc.procedures_for(hid) if hid else []
 
-    rows = svc.list_my(
+    # só a primeira tela do histórico; o restante vem de history_json
+    page = svc.page_my(
         doctor_user_id=uid,
         hospital_id=hid,
         date_from=dfrom,
         date_to=dto,
-        procedure_id=pid
+        procedure_id=pid,
+        per_page=HISTORY_PAGE,
     )
 
     return render_template(
         "doctor/production_form.html",
         hospitals=hospitals,
-        rows=rows,
+        rows=page.rows,
+        next_cursor=page.next_cursor,
         f_hospital_id=hid,
         f_procedure_id=pid,
         f_date_from=dfrom or "",
@@ -52,6 +59,36 @@ def production_form():
         filter_procedures=filter_procedures
     )
 
+@bp.route("/production/history.json", methods=["GET"])
+def history_json():
+    """
+    Próxima página do histórico (rolagem infinita): mesmos filtros f_* da
+    tela + ?cursor= (next_cursor da página anterior) e ?per_page=.
+    """
+    uid = session["user_id"]
+    hid_f = request.args.get("f_hospital_id")
+    pid_f = request.args.get("f_procedure_id")
+
+    page = svc.page_my(
+        doctor_user_id=uid,
+        hospital_id=int(hid_f) if (hid_f and hid_f.isdigit()) else None,
+        date_from=request.args.get("f_date_from"),
+        date_to=request.args.get("f_date_to"),
+        procedure_id=int(pid_f) if (pid_f and pid_f.isdigit()) else None,
+        after=decode_cursor(request.args.get("cursor")),
+        per_page=page_size(request.args.get("per_page"), HISTORY_PAGE),
+    )
+    rows = [{
+        "id": r.id,
+        "exec_date": r.exec_date.isoformat(),
+        "exec_date_br": brdate(r.exec_date),
+        "hospital_name": r.hospital_name,
+        "procedure_name": r.procedure_name,
+        "quantity": r.quantity,
+        "note": r.note or "",
+    } for r in page.rows]
+    return jsonify({"ok": True, "rows": rows, "next_cursor": page.next_cursor})
+
 @bp.route("/production/procedures", methods=["GET"])
 def ajax_procedures_by_hospital():
     uid = session["user_id"]
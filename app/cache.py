@@ -0,0 +1,136 @@
+# app/cache.py
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+import threading
+import time
+import weakref
+
+
+_default_ttl = 60.0     # RESULT_CACHE_TTL (s; 0 = não guarda, só coalesce)
+_default_maxsize = 256  # RESULT_CACHE_SIZE (entradas por cache)
+_caches: "weakref.WeakSet[ResultCache]" = weakref.WeakSet()
+_registry_lock = threading.Lock()
+
+
+class _Flight:
+    """Carga em andamento de uma chave: quem chega depois espera por ela."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: BaseException | None = None
+
+
+class ResultCache:
+    """
+    Cache de resultados em memória (por processo), com TTL e LRU:
+      cache = ResultCache(tags=("productions",))
+      data = cache.get_or_load(filtros, lambda: consulta_cara(...))
+
+    - `ttl` (s): validade de cada entrada; `maxsize`: entradas mantidas,
+      descartando as usadas há mais tempo;
+    - single-flight: pedidos simultâneos da mesma chave esperam a carga
+      do primeiro em vez de irem todos ao banco;
+    - `tags`: invalidate("productions") esvazia todos os caches marcados.
+      Uma carga que começou antes da invalidação não é guardada.
+
+    Cada worker do gunicorn tem o seu: a invalidação vale para o processo
+    que gravou; nos demais o dado vive no máximo `ttl` segundos.
+    """
+
+    def __init__(self, maxsize: int | None = None, ttl: float | None = None,
+                 tags: tuple[str, ...] = ()):
+        self.maxsize = _default_maxsize if maxsize is None else maxsize
+        self.ttl = _default_ttl if ttl is None else ttl
+        self.tags = frozenset(tags)
+        self._fixed = (maxsize is not None, ttl is not None)
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._flights: dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = self.misses = self.coalesced = 0
+        with _registry_lock:
+            _caches.add(self)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                if flight.error is None and self.ttl > 0 and generation == self._generation:
+                    self._data[key] = (time.monotonic() + self.ttl, flight.value)
+                    self._data.move_to_end(key)
+                    while len(self._data) > self.maxsize:
+                        self._data.popitem(last=False)
+            flight.done.set()
+        return flight.value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
+
+
+def invalidate(tag: str) -> None:
+    """Esvazia os caches marcados com `tag` (chamar depois do commit da escrita)."""
+    with _registry_lock:
+        caches = list(_caches)
+    for cache in caches:
+        if tag in cache.tags:
+            cache.clear()
+
+
+def init_app(app) -> None:
+    """
+    Aplica RESULT_CACHE_TTL / RESULT_CACHE_SIZE do app.config aos caches
+    sem ttl/maxsize explícitos (já é feito em create_app()).
+    """
+    global _default_ttl, _default_maxsize
+    _default_ttl = float(app.config.get("RESULT_CACHE_TTL", _default_ttl))
+    _default_maxsize = int(app.config.get("RESULT_CACHE_SIZE", _default_maxsize))
+    with _registry_lock:
+        caches = list(_caches)
+    for cache in caches:
+        fixed_size, fixed_ttl = cache._fixed
+        if not fixed_size:
+            cache.maxsize = _default_maxsize
+        if not fixed_ttl:
+            cache.ttl = _default_ttl
@@ -0,0 +1,38 @@
+# app/cli.py
+import click
+from flask.cli import AppGroup
+
+from .repositories.doctor_summary import DoctorSummaryRepository
+from .repositories.expenses import ExpensesRepository
+from .repositories.production_rollup import ProductionRollupRepository
+from .repositories.productions import ProductionRepository
+from .schema import ensure_schema
+
+db_cli = AppGroup("db", help="Tabelas e índices auxiliares do banco.")
+rollup_cli = AppGroup("rollup", help="Tabela production_rollup (agregados dos dashboards).")
+
+
+@db_cli.command("init")
+def db_init():
+    """Cria (se não existirem) as tabelas auxiliares e os índices de productions/expenses."""
+    n = ensure_schema()
+    if n:
+        click.echo(f"production_rollup preenchida: {n} chave(s).")
+    ProductionRepository().ensure_indexes()
+    ExpensesRepository().ensure_indexes()
+    click.echo("Tabelas e índices prontos.")
+
+
+@rollup_cli.command("rebuild")
+def rollup_rebuild():
+    """Recalcula production_rollup (e os doctor_summary) a partir de productions."""
+    n = ProductionRollupRepository().rebuild()
+    click.echo(f"production_rollup reconstruída: {n} chave(s).")
+    n = DoctorSummaryRepository().rebuild()
+    click.echo(f"doctor_summary recalculado para {n} médico(s).")
+
+
+def register_cli(app) -> None:
+    """Comandos `flask ...` do app (já é feito em create_app())."""
+    app.cli.add_command(db_cli)
+    app.cli.add_command(rollup_cli)
@@ -1,30 +1,825 @@
-# app/db.py
 from contextlib import contextmanager
-from psycopg2.pool import SimpleConnectionPool
+from collections import Counter
+from functools import lru_cache
+from flask import current_app, g, has_request_context, request
+from psycopg2.pool import AbstractConnectionPool, PoolError
+import logging
+import queue
+import re
+import threading
+import time
+import uuid
+import zlib
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 import psycopg2.extras
 
-_pool: SimpleConnectionPool | None = None
 
-def init_db(db_cfg: dict) -> None:
+log = logging.getLogger(__name__)
+
+
+class _TimedCursorMixin:
+    """
+    Mede cada consulta do cursor (ver _record_query).
+
+    Cursor nomeado (server-side, iter_query): o execute() só faz o DECLARE
+    e o custo real está nos FETCH, feitos durante a leitura. Aí o tempo do
+    execute e de cada fetch/iteração é somado e registrado uma vez, como
+    uma consulta só, quando o cursor chega ao fim ou é fechado.
+    """
+
+    _streamed_query = None
+    _streamed_elapsed = 0.0
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        if self.name is not None:
+            self._streamed_query = query
+            try:
+                return super().execute(query, vars)
+            finally:
+                self._streamed_elapsed += time.perf_counter() - start
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record_query(query, time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size)
+
+    def fetchall(self):
+        rows = self._timed_fetch(super().fetchall)
+        self._record_streamed()
+        return rows
+
+    def __iter__(self):
+        if self._streamed_query is None:
+            yield from super().__iter__()
+            return
+        rows = super().__iter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                self._streamed_elapsed += time.perf_counter() - start
+                self._record_streamed()
+                return
+            self._streamed_elapsed += time.perf_counter() - start
+            yield row
+
+    def close(self):
+        try:
+            return super().close()
+        finally:
+            self._record_streamed()
+
+    def _timed_fetch(self, fetch, *args):
+        if self._streamed_query is None:
+            return fetch(*args)
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._streamed_elapsed += time.perf_counter() - start
+
+    def _record_streamed(self) -> None:
+        query, self._streamed_query = self._streamed_query, None
+        if query is not None:
+            _record_query(query, self._streamed_elapsed)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record_query(query, time.perf_counter() - start)
+
+
+class InstrumentedCursor(_TimedCursorMixin, psycopg2.extras.DictCursor):
+    """Cursor padrão do pool: DictCursor instrumentado."""
+
+
+class TupleCursor(_TimedCursorMixin, psycopg2.extensions.cursor):
+    """
+    Cursor de tuplas simples (instrumentado), para mapear direto nas
+    linhas compactas de app.models:
+      with get_conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cur:
+          cur.execute(sql, params)
+          return ProductionRow.from_rows(cur)
+    """
+
+
+class AppConnection(psycopg2.extensions.connection):
+    """
+    Conexão do pool; guarda os statements já preparados nesta sessão e
+    quando foi aberta/usada pela última vez (pre-ping e reciclagem).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
+        self.prepared_stale = False
+        self.created_at = self.last_used = time.monotonic()
+
+    def reset_prepared(self) -> None:
+        """DEALLOCATE ALL: os statements são preparados de novo no próximo uso."""
+        with self.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.execute("DEALLOCATE ALL")
+        self.commit()
+        self.prepared.clear()
+        self.prepared_stale = False
+
+
+class PoolTimeout(PoolError):
+    """Nenhuma conexão liberada dentro do tempo de espera configurado."""
+
+
+class BlockingConnectionPool(AbstractConnectionPool):
+    """
+    Pool thread-safe para workers gthread do gunicorn.
+
+    Diferente do SimpleConnectionPool (que não é thread-safe e levanta
+    PoolError assim que as `maxconn` conexões estão em uso), aqui quem pede
+    conexão com o pool cheio espera numa fila limitada:
+      - `timeout`: segundos máximos de espera (PoolTimeout ao estourar);
+      - `max_waiters`: tamanho máximo da fila (PoolError imediato se cheia).
+
+    `max_idle` é quantas conexões ociosas ficam abertas para reuso (o pool
+    do psycopg2 guarda só `minconn` e fecha o resto a cada putconn, o que
+    custa um handshake TLS novo a cada pico). Padrão: `maxconn`.
+
+    `reserve` é quantas das `maxconn` vagas só getconn(use_reserve=True)
+    ocupa: conexões auxiliares (iter_query, copy_csv) pedidas por quem já
+    segura outra conexão (DB_REQUEST_SCOPED). Sem essa folga, com todas as
+    threads segurando a conexão do request, nenhuma consegue a segunda e
+    todas esperam até o timeout.
+
+    Saúde das conexões (Postgres serverless derruba conexões ociosas):
+      - `ping_after`: conexão parada há mais que isso (s) leva um
+        `SELECT 1` antes de ser entregue; se falhar, é trocada por outra;
+      - `max_lifetime`: conexão mais velha que isso (s) é fechada e reaberta;
+      - maintain(): pinga/recicla as ociosas e reabre até `minconn`
+        (chamado pela thread de manutenção, ver start_pool_maintenance).
+    """
+
+    def __init__(self, minconn, maxconn, *args, timeout=30.0, max_waiters=50,
+                 max_idle=None, ping_after=30.0, max_lifetime=1800.0, reserve=0, **kwargs):
+        self._cond = threading.Condition()
+        self.timeout = timeout
+        self.max_waiters = max_waiters
+        self.max_idle = maxconn if max_idle is None else max_idle
+        self.ping_after = ping_after
+        self.max_lifetime = max_lifetime
+        self.reserve = max(0, min(int(reserve), maxconn - 1))
+        self._recycled = 0
+        self._connecting = 0  # vagas reservadas com conexão sendo aberta
+        self._waiting = 0
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None, use_reserve=False):
+        # valida fora do lock: o ping é uma ida e volta ao servidor
+        for _ in range(self.maxconn + 1):
+            conn = self._acquire(key, use_reserve)
+            if self._healthy(conn):
+                return conn
+            self.putconn(conn, key, close=True)
+            with self._cond:
+                self._recycled += 1
+        raise PoolError("não foi possível obter uma conexão saudável do pool")
+
+    def _acquire(self, key=None, use_reserve=False):
+        with self._cond:
+            if self.closed:
+                raise PoolError("connection pool is closed")
+
+            if not self._has_room(use_reserve):
+                if self._waiting >= self.max_waiters:
+                    raise PoolError("connection pool exhausted (fila de espera cheia)")
+
+                start = time.monotonic()
+                deadline = start + self.timeout
+                self._waiting += 1
+                try:
+                    while not self._has_room(use_reserve) and not self.closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise PoolTimeout(
+                                f"Nenhuma conexão livre após {self.timeout:.1f}s "
+                                f"({len(self._used)} em uso, {self._waiting} aguardando)."
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                    waited = time.monotonic() - start
+                    self._wait_count += 1
+                    self._wait_total += waited
+                    self._wait_max = max(self._wait_max, waited)
+                if self.closed:
+                    raise PoolError("connection pool is closed")
+
+            if key is None:
+                key = self._getkey()
+            if key in self._used:
+                return self._used[key]
+            if self._pool:
+                conn = self._pool.pop()
+                self._used[key] = conn
+                self._rused[id(conn)] = key
+                return conn
+            # reserva a vaga e conecta fora do lock: o handshake (TCP/TLS/auth)
+            # não pode segurar quem só quer pegar/devolver uma conexão ociosa
+            self._connecting += 1
+
+        conn = self._open_reserved()
+        with self._cond:
+            if self.closed:
+                conn.close()
+                raise PoolError("connection pool is closed")
+            self._used[key] = conn
+            self._rused[id(conn)] = key
+        return conn
+
+    def _has_room(self, use_reserve: bool = False) -> bool:
+        """
+        Cabe mais uma conexão em uso (em uso + sendo abertas < maxconn)?
+        Sem use_reserve, as `reserve` últimas vagas não contam.
+        """
+        limit = self.maxconn if use_reserve else self.maxconn - self.reserve
+        return len(self._used) + self._connecting < limit
+
+    def _notify(self) -> None:
+        # com reserva, uma vaga liberada pode servir só a quem usa a reserva:
+        # acorda todos para não "perder" o aviso num que não pode usá-la
+        if self.reserve:
+            self._cond.notify_all()
+        else:
+            self._cond.notify()
+
+    def _open_reserved(self):
+        """Abre a conexão de uma vaga reservada (_connecting); desfaz a reserva se falhar."""
+        try:
+            conn = psycopg2.connect(*self._args, **self._kwargs)
+        except BaseException:
+            with self._cond:
+                self._connecting -= 1
+                self._notify()
+            raise
+        with self._cond:
+            self._connecting -= 1
+        return conn
+
+    def _healthy(self, conn, force_ping: bool = False) -> bool:
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - getattr(conn, "created_at", now) > self.max_lifetime:
+            return False
+        idle = now - getattr(conn, "last_used", now)
+        if not force_ping and (self.ping_after is None or idle < self.ping_after):
+            return True
+        try:
+            # cursor cru: o ping não entra nas estatísticas do request
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        conn.last_used = time.monotonic()
+        return True
+
+    def maintain(self) -> int:
+        """
+        Pinga as conexões ociosas, fecha as mortas/velhas e reabre até
+        `minconn`. Retorna quantas conexões foram recicladas.
+
+        Uma conexão por vez, retirada do pool como "em uso" durante o ping:
+        o total de conexões nunca passa de maxconn e os requests continuam
+        pegando as outras ociosas normalmente.
+        """
+        with self._cond:
+            if self.closed:
+                return 0
+            idle = list(self._pool)
+
+        recycled = 0
+        for conn in idle:
+            with self._cond:
+                if self.closed:
+                    return recycled
+                if not any(c is conn for c in self._pool):
+                    continue  # já foi entregue a um request
+                self._pool.remove(conn)
+                key = self._getkey()
+                self._used[key] = conn
+                self._rused[id(conn)] = key
+            ok = self._healthy(conn, force_ping=True)
+            if not ok:
+                recycled += 1
+                with self._cond:
+                    self._recycled += 1
+            self.putconn(conn, key, close=not ok)
+
+        # reabre até minconn, conectando fora do lock como no _acquire()
+        while True:
+            with self._cond:
+                if self.closed or (
+                    len(self._pool) + len(self._used) + self._connecting >= self.minconn
+                ):
+                    break
+                self._connecting += 1
+            conn = self._open_reserved()
+            with self._cond:
+                if self.closed:
+                    conn.close()
+                    break
+                self._pool.append(conn)
+                self._notify()
+        return recycled
+
+    def putconn(self, conn=None, key=None, close=False):
+        if conn is not None:
+            conn.last_used = time.monotonic()
+        with self._cond:
+            try:
+                self._putconn(conn, key, close)
+            finally:
+                self._notify()
+
+    def _putconn(self, conn, key=None, close=False):
+        # mesma lógica do AbstractConnectionPool, mas guardando até max_idle
+        if self.closed:
+            raise PoolError("connection pool is closed")
+        if key is None:
+            key = self._rused.get(id(conn))
+            if key is None:
+                raise PoolError("trying to put unkeyed connection")
+
+        if len(self._pool) < max(self.minconn, self.max_idle) and not close:
+            if not conn.closed:
+                status = conn.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    conn.close()  # conexão com o servidor perdida
+                else:
+                    if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    if getattr(conn, "prepared_stale", False):
+                        self._reset_prepared(conn)
+                    if not conn.closed:
+                        self._pool.append(conn)
+        else:
+            conn.close()
+
+        if not self.closed or key in self._used:
+            del self._used[key]
+            del self._rused[id(conn)]
+
+    @staticmethod
+    def _reset_prepared(conn) -> None:
+        # ex.: ALTER TABLE mudou o resultado de um statement preparado
+        # ("cached plan must not change result type")
+        try:
+            conn.reset_prepared()
+        except psycopg2.Error:
+            conn.close()
+
+    def closeall(self):
+        with self._cond:
+            self._closeall()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Retrato do pool: conexões em uso/ociosas, fila e tempos de espera."""
+        with self._cond:
+            return {
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "reserve": self.reserve,
+                "in_use": len(self._used),
+                "connecting": self._connecting,
+                "idle": len(self._pool),
+                "max_idle": self.max_idle,
+                "waiting": self._waiting,
+                "max_waiters": self.max_waiters,
+                "wait_count": self._wait_count,
+                "wait_total_s": round(self._wait_total, 4),
+                "wait_max_s": round(self._wait_max, 4),
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+            }
+
+
+_pool: BlockingConnectionPool | None = None
+_replica_pool: BlockingConnectionPool | None = None
+_request_scoped = False
+_itersize = 2000  # linhas por FETCH nos cursores nomeados (DB_ITERSIZE)
+_prepare_enabled = True
+_instrument = True
+_slow_query_ms = 200.0   # DB_SLOW_QUERY_MS
+_nplus1_threshold = 10   # DB_NPLUS1_THRESHOLD
+_statement_timeout_ms = 0               # DB_STATEMENT_TIMEOUT_MS (0 = sem limite)
+_route_timeouts: dict[str, int] = {}    # DB_STATEMENT_TIMEOUTS (endpoint -> ms)
+
+# roteamento de leituras para a réplica (ver _replica_checkout)
+_replica_max_lag = 30.0       # s de atraso aceitável (DB_REPLICA_MAX_LAG)
+_replica_retry_after = 30.0   # s fora de uso após falha/atraso (DB_REPLICA_RETRY_AFTER)
+_replica_lag_every = 10.0     # s entre medições de atraso
+_replica_down_until = 0.0
+_replica_lag_checked_at = 0.0
+
+def _new_pool(db_cfg: dict, pool_cfg: dict, minconn: int) -> BlockingConnectionPool:
+    return BlockingConnectionPool(
+        minconn=minconn,
+        maxconn=pool_cfg.get("maxconn", 10),
+        timeout=pool_cfg.get("timeout", 30.0),
+        max_waiters=pool_cfg.get("max_waiters", 50),
+        max_idle=pool_cfg.get("max_idle"),
+        ping_after=pool_cfg.get("ping_after", 30.0),
+        max_lifetime=pool_cfg.get("max_lifetime", 1800.0),
+        reserve=pool_cfg.get("reserve", 0),
+        cursor_factory=InstrumentedCursor,  # DictCursor: rows acessíveis por nome
+        connection_factory=AppConnection,
+        **db_cfg,
+    )
+
+def init_db(db_cfg: dict, pool_cfg: dict | None = None, replica_cfg: dict | None = None) -> None:
     """
     Inicializa o pool de conexões. Deve ser chamado uma vez no startup
     (já é feito em create_app()).
 
     db_cfg vem do Config.DB_CFG e pode conter:
       host, port, dbname, user, password, sslmode, connect_timeout...
+
+    pool_cfg vem do Config.DB_POOL (minconn, maxconn, timeout, max_waiters,
+    reserve...).
+
+    replica_cfg (opcional) vem do Config.DB_REPLICA_CFG: mesmo formato do
+    db_cfg, apontando para uma réplica de leitura. O pool da réplica não
+    abre conexões no boot, então uma réplica fora do ar não derruba o app.
     """
-    global _pool
+    global _pool, _replica_pool
     if _pool is not None:
         return  # já inicializado
 
-    # Pool com 1..10 conexões (ajuste se necessário)
-    _pool = SimpleConnectionPool(
-        minconn=1,
-        maxconn=10,
-        cursor_factory=psycopg2.extras.DictCursor,  # rows acessíveis por nome
-        **db_cfg,
+    pool_cfg = pool_cfg or {}
+    _pool = _new_pool(db_cfg, pool_cfg, minconn=pool_cfg.get("minconn", 1))
+    if replica_cfg:
+        _replica_pool = _new_pool(replica_cfg, pool_cfg, minconn=0)
+
+def init_app(app) -> None:
+    """
+    Lê as opções de uso do banco do app.config e registra os hooks do modo
+    "uma conexão por request" quando DB_REQUEST_SCOPED está ligado
+    (já é feito em create_app()).
+
+    Nesse modo, todo get_conn() dentro de um request devolve a mesma
+    conexão (guardada em flask.g) e o request inteiro vira uma transação:
+    commit no after_request (respostas < 500) e devolução ao pool no
+    teardown_request. As tarefas de after_commit() rodam nessa mesma
+    conexão, depois do commit. iter_query/copy_csv continuam com conexão
+    própria (o corpo em streaming é lido depois do commit do request, que
+    fecharia o cursor): elas usam as vagas de reserva do pool
+    (DB_POOL_RESERVE), então um request nunca espera por outro para pegar
+    a segunda conexão.
+    """
+    global _request_scoped, _itersize, _prepare_enabled
+    global _replica_max_lag, _replica_retry_after
+    global _instrument, _slow_query_ms, _nplus1_threshold
+    global _statement_timeout_ms, _route_timeouts
+    _itersize = int(app.config.get("DB_ITERSIZE", _itersize))
+    _prepare_enabled = bool(app.config.get("DB_PREPARED_STATEMENTS", True))
+    _replica_max_lag = float(app.config.get("DB_REPLICA_MAX_LAG", _replica_max_lag))
+    _replica_retry_after = float(app.config.get("DB_REPLICA_RETRY_AFTER", _replica_retry_after))
+    _instrument = bool(app.config.get("DB_INSTRUMENT", True))
+    _slow_query_ms = float(app.config.get("DB_SLOW_QUERY_MS", _slow_query_ms))
+    _nplus1_threshold = int(app.config.get("DB_NPLUS1_THRESHOLD", _nplus1_threshold))
+    _statement_timeout_ms = int(app.config.get("DB_STATEMENT_TIMEOUT_MS", 0))
+    _route_timeouts = {k: int(v) for k, v in (app.config.get("DB_STATEMENT_TIMEOUTS") or {}).items()}
+    app.register_error_handler(psycopg2.extensions.QueryCanceledError, _query_canceled)
+    if _instrument:
+        app.after_request(_report_request_queries)
+    if app.config.get("DB_POOL_WARM_UP", True):
+        try:
+            warm_up()  # abre as minconn no boot do worker, não no 1º request
+        except psycopg2.Error:
+            log.warning("Pool: não foi possível pré-abrir conexões no boot.", exc_info=True)
+    start_pool_maintenance(float(app.config.get("DB_POOL_MAINTENANCE_INTERVAL", 0)))
+
+    _request_scoped = bool(app.config.get("DB_REQUEST_SCOPED"))
+    if not _request_scoped:
+        return
+    app.after_request(_commit_request_conn)
+    app.teardown_request(_release_request_conn)
+
+# ---------------------------
+# Instrumentação
+# ---------------------------
+_FP_COMMENT_RE = re.compile(r"--[^\n]*")
+_FP_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_FP_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_FP_SPACE_RE = re.compile(r"\s+")
+# lista de tuplas já com os valores (execute_values): "VALUES (...), (...)"
+_FP_TUPLE = r"\((?:[^()']|'(?:[^']|'')*')*\)"
+_FP_VALUES_RE = re.compile(rf"\bVALUES\s*{_FP_TUPLE}(?:\s*,\s*{_FP_TUPLE})*", re.IGNORECASE)
+
+def fingerprint(sql: str) -> str:
+    """SQL normalizado: sem comentários, literais trocados por ?, espaços colapsados."""
+    # execute_values manda os valores no texto: cada lote seria um SQL
+    # diferente e encheria o cache abaixo; a lista vira "VALUES (...)" antes
+    if "VALUES" in sql or "values" in sql:
+        sql = _FP_VALUES_RE.sub("VALUES (...)", sql)
+    return _fingerprint(sql)
+
+@lru_cache(maxsize=512)
+def _fingerprint(sql: str) -> str:
+    fp = _FP_COMMENT_RE.sub(" ", sql)
+    fp = _FP_STRING_RE.sub("?", fp)
+    fp = _FP_NUMBER_RE.sub("?", fp)
+    return _FP_SPACE_RE.sub(" ", fp).strip().rstrip(";").strip()
+
+def _record_query(query, elapsed: float) -> None:
+    """
+    Anota a consulta nas estatísticas do request atual (contagem, tempo
+    total e contagem por fingerprint) e loga as lentas
+    (>= DB_SLOW_QUERY_MS), dentro ou fora de request.
+    """
+    if not _instrument:
+        return
+    if not isinstance(query, str):
+        query = query.decode() if isinstance(query, bytes) else str(query)
+    fp = fingerprint(query)
+    ms = elapsed * 1000
+    if ms >= _slow_query_ms:
+        log.warning("Consulta lenta (%.0f ms): %s", ms, fp[:500])
+    stats = _request_stats() if has_request_context() else getattr(_tls, "query_stats", None)
+    if stats is not None:
+        with _stats_lock:
+            stats["count"] += 1
+            stats["time_ms"] += ms
+            stats["by_fp"][fp] += 1
+
+_tls = threading.local()      # estatísticas herdadas pelas threads auxiliares (copy_csv)
+_stats_lock = threading.Lock()
+
+def _request_stats() -> dict:
+    stats = g.get("db_queries")
+    if stats is None:
+        stats = g.db_queries = {"count": 0, "time_ms": 0.0, "by_fp": Counter()}
+    return stats
+
+def query_stats() -> dict | None:
+    """Estatísticas de consultas do request atual (None se nenhuma rodou)."""
+    return g.get("db_queries") if has_request_context() else None
+
+def _report_request_queries(response):
+    stats = g.get("db_queries")
+    if not stats:
+        return response
+    for fp, n in stats["by_fp"].most_common():
+        if n <= _nplus1_threshold:
+            break
+        log.warning(
+            "Possível N+1 em %s: %d× a mesma consulta: %s",
+            request.endpoint, n, fp[:300],
+        )
+    log.debug(
+        "%s: %d consulta(s), %.1f ms no banco",
+        request.endpoint, stats["count"], stats["time_ms"],
+    )
+    response.headers.add(
+        "Server-Timing", f'db;dur={stats["time_ms"]:.1f};desc="{stats["count"]} queries"'
     )
+    return response
+
+# ---------------------------
+# Threads auxiliares (COPY)
+# ---------------------------
+def _call_with_stats(stats, timeout_ms, fn, *args, **kwargs):
+    """
+    Roda `fn` numa thread fora do request herdando as estatísticas e o
+    statement_timeout do request que a disparou (ver copy_csv).
+    """
+    _tls.query_stats = stats
+    _tls.statement_timeout_ms = timeout_ms
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _tls.query_stats = None
+        _tls.statement_timeout_ms = 0
+
+# ---------------------------
+# statement_timeout por rota
+# ---------------------------
+def statement_timeout(ms: int):
+    """
+    Define o orçamento (ms) das consultas de uma view; vai abaixo do
+    @bp.route:
+      @bp.route("/productions/export.xlsx")
+      @statement_timeout(120_000)
+      def export_xlsx(): ...
+    Consulta que passar disso é cancelada pelo Postgres (QueryCanceledError,
+    respondida com 503). DB_STATEMENT_TIMEOUTS no config tem precedência.
+    """
+    def decorator(fn):
+        fn.statement_timeout_ms = int(ms)
+        return fn
+    return decorator
+
+def _current_timeout() -> int:
+    """
+    statement_timeout (ms) das consultas do contexto atual: config da rota,
+    decorator da view ou DB_STATEMENT_TIMEOUT_MS. Fora de request
+    (CLI/scripts) só vale o herdado pelas threads auxiliares (copy_csv).
+    """
+    if not has_request_context():
+        return getattr(_tls, "statement_timeout_ms", 0)
+    endpoint = request.endpoint
+    if endpoint in _route_timeouts:
+        return _route_timeouts[endpoint]
+    view = current_app.view_functions.get(endpoint) if endpoint else None
+    return getattr(view, "statement_timeout_ms", _statement_timeout_ms)
+
+def _apply_timeout(conn) -> None:
+    """
+    SET LOCAL statement_timeout no início de cada transação: vale só até o
+    commit/rollback, então a conexão volta ao pool sem o limite da rota.
+    """
+    ms = _current_timeout()
+    if not ms or conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return
+    # cursor cru: não entra nas estatísticas do request
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+        cur.execute("SET LOCAL statement_timeout = %s", (int(ms),))
+
+def _query_canceled(exc):
+    log.warning(
+        "Consulta cancelada por statement_timeout (%d ms) em %s: %s",
+        _current_timeout(), request.endpoint, str(exc).strip(),
+    )
+    return (
+        "A consulta demorou demais e foi cancelada. "
+        "Refine os filtros (ex.: período menor) e tente novamente.",
+        503,
+        {"Retry-After": "30"},
+    )
+
+# ---------------------------
+# Réplica de leitura
+# ---------------------------
+def _mark_replica_down() -> None:
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + _replica_retry_after
+
+def _replica_checkout(use_reserve: bool = False):
+    """
+    Conexão da réplica, ou None se não há réplica, se ela falhou há pouco
+    ou se está atrasada mais que DB_REPLICA_MAX_LAG (quem chama cai no
+    primário). O atraso é medido no máximo a cada _replica_lag_every s.
+    """
+    global _replica_lag_checked_at
+    if _replica_pool is None or time.monotonic() < _replica_down_until:
+        return None
+    try:
+        conn = _replica_pool.getconn(use_reserve=use_reserve)
+    except (psycopg2.OperationalError, PoolError):
+        _mark_replica_down()
+        return None
+
+    if time.monotonic() - _replica_lag_checked_at < _replica_lag_every:
+        return conn
+    try:
+        with conn.cursor() as cur:
+            # réplica em dia (nada a aplicar) conta como atraso zero
+            cur.execute("""
+                SELECT CASE
+                         WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                         ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                       END;
+            """)
+            lag = float(cur.fetchone()[0] or 0)
+        conn.rollback()
+    except psycopg2.Error:
+        _replica_pool.putconn(conn, close=True)
+        _mark_replica_down()
+        return None
+
+    _replica_lag_checked_at = time.monotonic()
+    if lag > _replica_max_lag:
+        _replica_pool.putconn(conn)
+        _mark_replica_down()
+        return None
+    return conn
+
+def _release(conn, pool, exc: BaseException | None = None) -> None:
+    """
+    Devolve a conexão ao pool de origem; conexão quebrada é descartada.
+    Consulta cancelada (statement_timeout) não quebra a conexão: depois
+    do rollback ela volta limpa ao pool.
+    """
+    broken = bool(conn.closed) or (
+        isinstance(exc, psycopg2.OperationalError)
+        and not isinstance(exc, psycopg2.extensions.QueryCanceledError)
+    )
+    if broken and pool is _replica_pool:
+        _mark_replica_down()
+    if pool is not None:
+        pool.putconn(conn, close=broken)
+
+# ---------------------------
+# Conexão por request
+# ---------------------------
+_REQUEST_SLOTS = (("db_conn", lambda: _pool), ("db_replica_conn", lambda: _replica_pool))
+
+def _request_conn(readonly: bool = False):
+    conn = g.get("db_conn")
+    if conn is not None:
+        return conn  # o request já usa o primário: lê o que ele mesmo gravou
+    if readonly:
+        conn = g.get("db_replica_conn") or _replica_checkout()
+        if conn is not None:
+            g.db_replica_conn = conn
+            return conn
+    conn = g.db_conn = _pool.getconn()
+    return conn
+
+def _commit_request_conn(response):
+    for slot, _ in _REQUEST_SLOTS:
+        conn = g.get(slot)
+        if conn is not None:
+            if response.status_code < 500:
+                conn.commit()
+            else:
+                conn.rollback()
+    pending = g.pop("db_after_commit", None)
+    if pending and response.status_code < 500:
+        _run_after_commit(pending, g.get("db_conn"))
+    return response
+
+def after_commit(fn) -> None:
+    """
+    Agenda fn(cur) para depois do commit da escrita atual, numa transação
+    curta e própria. Para o que não deve segurar locks durante a escrita,
+    ex.: a versão dos dados (data_versions.bump_after_commit).
+
+    Fora do modo request-scoped roda na hora, numa conexão do pool: chame
+    depois do `with get_conn()` da escrita, que já fez commit. No modo
+    request-scoped roda depois do commit do request, na própria conexão
+    do request (e é descartada se ele for desfeito).
+    Falhas só vão para o log: a escrita principal já está gravada.
+    """
+    if _request_scoped and has_request_context() and g.get("db_conn") is not None:
+        g.setdefault("db_after_commit", []).append(fn)
+        return
+    _run_after_commit([fn])
+
+def _run_after_commit(fns, conn=None) -> None:
+    """Roda as tarefas de after_commit() em `conn` (já comitada) ou numa do pool."""
+    try:
+        if conn is None:
+            with _pooled_conn() as own, own.cursor() as cur:
+                for fn in fns:
+                    fn(cur)
+            return
+        try:
+            with conn.cursor() as cur:
+                for fn in fns:
+                    fn(cur)
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+    except Exception:
+        log.exception("Falha em tarefa pós-commit.")
+
+def _release_request_conn(exc=None) -> None:
+    pending = g.pop("db_after_commit", None)
+    for slot, pool in _REQUEST_SLOTS:
+        conn = g.pop(slot, None)
+        if conn is None:
+            continue
+        try:
+            # sobra de transação (ex.: resposta em streaming depois do after_request)
+            if exc is None and not conn.closed:
+                conn.commit()
+                if pending and slot == "db_conn":
+                    _run_after_commit(pending, conn)
+            elif not conn.closed:
+                conn.rollback()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+        finally:
+            _release(conn, pool(), exc)
 
 def _ensure_pool() -> None:
     if _pool is None:
@@ -34,24 +829,214 @@ def _ensure_pool() -> None:
         )
 
 @contextmanager
-def get_conn():
+def get_conn(readonly: bool = False):
     """
     Uso:
       with get_conn() as conn, conn.cursor() as cur:
           cur.execute("SELECT 1")
           ...
     Faz commit no sucesso e rollback em caso de exceção.
+    Com o pool cheio, espera até DB_POOL_TIMEOUT segundos por uma conexão.
+
+    readonly=True manda a consulta para a réplica de leitura (se houver
+    DB_REPLICA_CFG), voltando ao primário quando ela está fora do ar ou
+    atrasada. Use só em consultas que não gravam nada.
+
+    Com DB_REQUEST_SCOPED ligado, dentro de um request devolve a conexão
+    do request: não faz commit aqui (o request é uma transação só) e uma
+    exceção desfaz tudo o que o request já gravou.
+
+    Cada transação começa com o statement_timeout da rota
+    (ver statement_timeout()).
     """
     _ensure_pool()
-    conn = _pool.getconn()
+    if _request_scoped and has_request_context():
+        conn = _request_conn(readonly)
+        try:
+            _apply_timeout(conn)
+            yield conn
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        return
+
+    with _pooled_conn(readonly) as conn:
+        yield conn
+
+@contextmanager
+def _pooled_conn(readonly: bool = False, aux: bool = False):
+    """
+    Conexão própria do pool (ignora o modo request-scoped). aux=True para
+    as auxiliares (streaming/COPY), que podem usar as vagas de reserva.
+    """
+    conn = _replica_checkout(use_reserve=aux) if readonly else None
+    pool = _replica_pool if conn is not None else _pool
+    if conn is None:
+        conn = _pool.getconn(use_reserve=aux)
+    exc = None
     try:
+        _apply_timeout(conn)
         yield conn
         conn.commit()
-    except Exception:
-        conn.rollback()
+    except Exception as e:
+        exc = e
+        if not conn.closed:
+            conn.rollback()
         raise
     finally:
-        _pool.putconn(conn)
+        _release(conn, pool, exc)
+
+def iter_query(sql: str, params=None, itersize: int | None = None, readonly: bool = False,
+               row_type=None):
+    """
+    Gerador de linhas via cursor nomeado (server-side): o resultado fica no
+    Postgres e vem em lotes de `itersize` linhas, então a memória não cresce
+    com o tamanho do resultado.
+      for row in iter_query("SELECT ... FROM productions", params):
+          ...
+    Usa uma conexão dedicada (nunca a do request; vem das vagas de reserva
+    do pool, ver init_app), presa ao pool até o gerador ser consumido ou
+    fechado; readonly=True como no get_conn().
+    Com `row_type` (ex.: models.ProductionRow) cada linha vira row_type(*tupla).
+    """
+    _ensure_pool()
+    with _pooled_conn(readonly, aux=True) as conn:
+        with _named_cursor(conn, row_type) as cur:
+            cur.itersize = itersize or _itersize
+            cur.execute(sql, params)
+            if row_type is None:
+                yield from cur
+            else:
+                for row in cur:
+                    yield row_type(*row)
+
+def _named_cursor(conn, row_type=None):
+    name = f"stream_{uuid.uuid4().hex}"
+    if row_type is None:
+        return conn.cursor(name=name)
+    return conn.cursor(name=name, cursor_factory=TupleCursor)
+
+# ---------------------------
+# COPY ... TO STDOUT (exportações CSV)
+# ---------------------------
+_COPY_END = object()
+
+def copy_csv(sql: str, params=None, readonly: bool = True, gzip: bool = False,
+             chunk_size: int = 64 * 1024):
+    """
+    Gerador de blocos (bytes) do CSV de `sql` (um SELECT com params no estilo
+    psycopg2), gerado pelo próprio Postgres via
+      COPY (<sql>) TO STDOUT WITH (FORMAT csv, HEADER true)
+    As linhas não viram objetos Python: os bytes do COPY são juntados em
+    blocos de ~chunk_size (comprimidos em gzip com gzip=True) e entregues
+    conforme chegam, prontos para uma resposta HTTP em streaming:
+      return Response(copy_csv(sql, params), mimetype="text/csv")
+
+    O copy_expert() do psycopg2 empurra os dados para um arquivo; ele roda
+    numa thread própria com conexão dedicada do pool (vagas de reserva, como
+    o iter_query) e uma fila curta faz a ponte (cliente lento segura o
+    COPY). Se o gerador for fechado antes do
+    fim (cliente desconectou), o COPY é cancelado no servidor e a conexão
+    volta limpa ao pool. Respeita o statement_timeout da rota que chamou.
+    """
+    _ensure_pool()
+    # lidos agora, no request: o corpo do gerador só roda durante o envio
+    stats = _request_stats() if (_instrument and has_request_context()) else None
+    return _copy_stream(sql, params, readonly, gzip, chunk_size, stats, _current_timeout())
+
+class _CopySink:
+    """Arquivo de escrita do copy_expert(): junta os bytes em blocos na fila."""
+
+    def __init__(self, out: queue.Queue, stop: threading.Event, gzip: bool, chunk_size: int):
+        self._out = out
+        self._stop = stop
+        self._chunk_size = chunk_size
+        self._buf = bytearray()
+        # wbits=31: cabeçalho/rodapé gzip (não zlib cru)
+        self._zip = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def write(self, data) -> None:
+        if self._stop.is_set():
+            return  # cancelamento a caminho: descarta o que ainda chegar
+        if self._zip is not None:
+            data = self._zip.compress(data)
+        self._buf += data
+        if len(self._buf) >= self._chunk_size:
+            self._put(bytes(self._buf))
+            self._buf.clear()
+
+    def flush(self) -> None:
+        if self._zip is not None:
+            self._buf += self._zip.flush()
+        if self._buf:
+            self._put(bytes(self._buf))
+            self._buf.clear()
+
+    def _put(self, chunk: bytes) -> None:
+        while not self._stop.is_set():
+            try:
+                self._out.put(chunk, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+def _copy_worker(sql, params, readonly, sink: _CopySink, out: queue.Queue, state: dict) -> None:
+    try:
+        with _pooled_conn(readonly, aux=True) as conn:
+            state["conn"] = conn
+            if sink.stopped:
+                return  # cliente já desistiu enquanto esperava conexão
+            # cursor cru: o COPY não aceita parâmetros, então vão embutidos via mogrify
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                query = cur.mogrify(sql.strip().rstrip(";"), params)
+                start = time.perf_counter()
+                copy = b"COPY (" + query + b") TO STDOUT WITH (FORMAT csv, HEADER true)"
+                cur.copy_expert(copy, sink)
+                _record_query(copy, time.perf_counter() - start)
+            sink.flush()
+    except BaseException as e:  # repassado ao gerador
+        state["error"] = e
+    finally:
+        state.pop("conn", None)
+        out.put(_COPY_END)
+
+def _copy_stream(sql, params, readonly, gzip, chunk_size, stats, timeout_ms):
+    out: queue.Queue = queue.Queue(maxsize=8)
+    stop = threading.Event()
+    state: dict = {}
+    sink = _CopySink(out, stop, gzip, chunk_size)
+    worker = threading.Thread(
+        target=_call_with_stats,
+        args=(stats, timeout_ms, _copy_worker, sql, params, readonly, sink, out, state),
+        name="db-copy",
+        daemon=True,
+    )
+    worker.start()
+    try:
+        while True:
+            chunk = out.get()
+            if chunk is _COPY_END:
+                break
+            yield chunk
+        if "error" in state:
+            raise state["error"]
+    finally:
+        if worker.is_alive():
+            # gerador fechado no meio: cancela o COPY e libera a thread
+            stop.set()
+            conn = state.get("conn")
+            if conn is not None and not conn.closed:
+                conn.cancel()
+            while True:
+                try:
+                    out.get_nowait()
+                except queue.Empty:
+                    break
 
 @contextmanager
 def get_cursor():
@@ -65,12 +1050,155 @@ def get_cursor():
         with conn.cursor() as cur:
             yield cur
 
+# ---------------------------
+# Statements preparados
+# ---------------------------
+_PLACEHOLDER_RE = re.compile(r"%%|%\((\w+)\)s|%s")
+_statements: dict[str, tuple[str, str]] = {}
+_statements_lock = threading.Lock()
+
+def _compile_statement(name: str, sql: str) -> tuple[str, str]:
+    """
+    Converte o SQL no estilo psycopg2 (%s / %(nome)s) em
+      PREPARE <name> AS ... $1, $2 ...
+      EXECUTE <name> (%s, ...)        -- ou (%(nome)s, ...)
+    Parâmetros nomeados repetidos viram o mesmo $n.
+    """
+    order: list[str] = []
+    positional = 0
+
+    def repl(m):
+        nonlocal positional
+        if m.group(0) == "%%":
+            return "%"
+        if m.group(1) is None:
+            positional += 1
+            order.append("%s")
+            return f"${positional}"
+        key = f"%({m.group(1)})s"
+        if key not in order:
+            order.append(key)
+        return f"${order.index(key) + 1}"
+
+    body = _PLACEHOLDER_RE.sub(repl, sql.strip().rstrip(";"))
+    if positional and len(order) != positional:
+        raise ValueError(f"Statement {name!r} mistura %s e %(nome)s.")
+    prepare_sql = f"PREPARE {name} AS {body}"
+    execute_sql = f"EXECUTE {name} ({', '.join(order)})" if order else f"EXECUTE {name}"
+    return prepare_sql, execute_sql
+
+def execute_prepared(cur, name: str, sql: str, params=None) -> None:
+    """
+    Executa `sql` como statement preparado da conexão do cursor:
+    na 1ª vez em cada conexão faz PREPARE; depois só EXECUTE, economizando
+    o planejamento (e o parse) a cada chamada. Use para as consultas quentes
+    com texto fixo:
+      execute_prepared(cur, "users_by_id", "SELECT id, username FROM users WHERE id=%s;", (uid,))
+    Liste as colunas (nada de SELECT *): o plano guarda o formato do
+    resultado, e um ALTER TABLE faria o EXECUTE falhar. Se falhar mesmo
+    assim, a conexão descarta seus statements ao voltar para o pool.
+
+    Com DB_PREPARED_STATEMENTS=0 (ex.: endpoint do Neon via PgBouncer em
+    modo transaction, que não mantém PREPARE entre transações) vira um
+    cur.execute() comum.
+    """
+    conn = cur.connection
+    prepared = getattr(conn, "prepared", None)
+    if not _prepare_enabled or prepared is None:
+        cur.execute(sql, params)
+        return
+
+    stmt = _statements.get(name)
+    if stmt is None:
+        with _statements_lock:
+            stmt = _statements.setdefault(name, _compile_statement(name, sql))
+    prepare_sql, execute_sql = stmt
+
+    if name not in prepared:
+        cur.execute(prepare_sql)
+        prepared.add(name)
+    try:
+        cur.execute(execute_sql, params)
+    except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.InvalidSqlStatementName):
+        # plano preparado inválido (esquema mudou) ou perdido no servidor:
+        # o putconn() faz DEALLOCATE ALL antes de devolver a conexão
+        conn.prepared_stale = True
+        raise
+
+# ---------------------------
+# Manutenção do pool
+# ---------------------------
+_maintenance_thread: threading.Thread | None = None
+
+def warm_up() -> int:
+    """
+    Abre/pinga as `minconn` conexões do primário (e revalida as ociosas da
+    réplica): o primeiro request não paga conexão nova nem compute "frio".
+    Retorna quantas conexões foram recicladas.
+    """
+    _ensure_pool()
+    recycled = _pool.maintain()
+    if _replica_pool is not None:
+        recycled += _replica_pool.maintain()
+    return recycled
+
+def start_pool_maintenance(interval: float) -> None:
+    """
+    Thread daemon que roda warm_up() a cada `interval` segundos
+    (DB_POOL_MAINTENANCE_INTERVAL; 0 desliga) e loga o pool_stats() quando
+    houve PoolTimeout desde a última volta. Mantém as conexões prontas
+    depois de longos períodos ociosos; atenção: no Neon isso também impede
+    o autosuspend do compute enquanto o worker estiver de pé.
+    Com `gunicorn --preload`, crie o app depois do fork (post_fork),
+    senão a thread e as conexões ficam só no master.
+    """
+    global _maintenance_thread
+    if interval <= 0 or _maintenance_thread is not None:
+        return
+
+    def _loop():
+        timeouts = 0
+        while _pool is not None:
+            time.sleep(interval)
+            try:
+                n = warm_up()
+                if n:
+                    log.info("Pool: %d conexão(ões) reciclada(s).", n)
+                stats = pool_stats()
+                if stats["timeouts"] > timeouts:
+                    # pool pequeno para a carga: aumente DB_POOL_MAX
+                    log.warning("Pool: %d espera(s) estourada(s) desde a última verificação: %s",
+                                stats["timeouts"] - timeouts, stats)
+                timeouts = stats["timeouts"]
+            except Exception:
+                log.exception("Falha na manutenção do pool de conexões.")
+
+    _maintenance_thread = threading.Thread(target=_loop, name="db-pool-maintenance", daemon=True)
+    _maintenance_thread.start()
+
+def pool_stats() -> dict:
+    """
+    Estatísticas do pool (em uso, aguardando, tempo de espera) deste
+    worker; servidas ao admin em GET /admin/db/pool.json.
+    """
+    _ensure_pool()
+    stats = _pool.stats()
+    if _replica_pool is not None:
+        stats["replica"] = {
+            **_replica_pool.stats(),
+            "available": time.monotonic() >= _replica_down_until,
+        }
+    return stats
+
 def close_pool() -> None:
     """
     Fecha todas as conexões do pool (útil em scripts/CLI/tests).
     No Render normalmente não é necessário chamar manualmente.
     """
-    global _pool
+    global _pool, _replica_pool
+    if _replica_pool is not None:
+        _replica_pool.closeall()
+        _replica_pool = None
     if _pool is not None:
         _pool.closeall()
         _pool = None
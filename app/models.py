@@ -1,6 +1,8 @@
 # app/models.py
 from dataclasses import dataclass
-from typing import Optional
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
 
 @dataclass
 class User:
@@ -28,3 +30,90 @@ class Doctor:
     rqe: Optional[str] = None
     cpf: Optional[str] = None
     rg: Optional[str] = None
+
+
+# ---------------------------------------------------------------------------
+# Linhas de consulta (uma classe por formato de SELECT)
+#
+# Compactas (__slots__, sem dict por linha) para listagens e exportações
+# grandes. Continuam acessíveis como atributo (templates: r.exec_date) e,
+# por compatibilidade, como r["campo"] / r.get("campo").
+# Os campos seguem a ORDEM das colunas do SELECT correspondente.
+# ---------------------------------------------------------------------------
+class _Row:
+    __slots__ = ()
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    @classmethod
+    def from_rows(cls, rows) -> list:
+        return [cls(*r) for r in rows]
+
+
+@dataclass(slots=True)
+class ProductionRow(_Row):
+    """ProductionRepository.list / iter_list."""
+    id: int
+    exec_date: date
+    quantity: int
+    unit_price: Optional[Decimal]
+    total: Decimal
+    note: Optional[str]
+    doctor_id: int
+    username: str
+    doctor_name: str
+    hospital_id: int
+    hospital_name: Optional[str]
+    procedure_id: int
+    tuss_code: Optional[str]
+    procedure_name: Optional[str]
+
+
+@dataclass(slots=True)
+class ExpenseRow(_Row):
+    """ExpensesRepository.list."""
+    id: int
+    request_date: date
+    city: Optional[str]
+    amount: Optional[Decimal]
+    description: Optional[str]
+    doctor_id: int
+    username: str
+    doctor_name: str
+
+
+@dataclass(slots=True)
+class ExpenseFilesRow(ExpenseRow):
+    """ExpensesRepository.iter_list (listagem do admin, com os comprovantes)."""
+    files: List[Dict[str, Any]]
+
+
+@dataclass(slots=True)
+class PriceRow(_Row):
+    """HospitalPriceRepository.list_for_hospital."""
+    id: int
+    hospital_id: int
+    procedure_id: int
+    tuss_code: Optional[str]
+    name: Optional[str]
+    price: Optional[Decimal]
+    start_date: Optional[date]
+    note: Optional[str]
+    active: bool
+
+
+@dataclass(slots=True)
+class ProcedurePriceRow(_Row):
+    """HospitalPriceRepository.list_procedures_for_hospital (preço ativo)."""
+    procedure_id: int
+    tuss_code: Optional[str]
+    name: Optional[str]
+    charge_unit: Optional[str]
+    price: Optional[Decimal]
@@ -0,0 +1,145 @@
+# app/pagination.py
+"""
+Paginação por chave (keyset) nas listagens ordenadas por (data, id) DESC.
+
+O cursor é a chave (data, id) da última/primeira linha da página, em
+base64 url-safe; a página seguinte é "(data, id) < cursor", servida pelo
+índice (data DESC, id DESC) com o mesmo custo em qualquer profundidade
+(sem OFFSET).
+"""
+import base64
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+PAGE_SIZES = (50, 100, 200, 500)
+DEFAULT_PAGE_SIZE = 100
+
+Cursor = Tuple[date, int]
+
+
+@dataclass(slots=True)
+class Page:
+    rows: List[Any] = field(default_factory=list)
+    per_page: int = DEFAULT_PAGE_SIZE
+    next_cursor: Optional[str] = None  # None = última página
+    prev_cursor: Optional[str] = None  # None = primeira página
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+
+class StreamedPage:
+    """
+    Page cujas linhas chegam de um gerador (cursor server-side) enquanto o
+    template é enviado (stream_template): `rows` só pode ser percorrido uma
+    vez, e count/next_cursor/prev_cursor valem depois disso — no template,
+    use-os abaixo da tabela. Lê per_page+1 linhas para saber se há mais.
+    """
+
+    __slots__ = ("per_page", "_source", "_key", "_after", "_first", "_last", "_count", "_more")
+
+    def __init__(self, source: Iterable[Any], per_page: int, key: Callable[[Any], Cursor], after: bool):
+        self.per_page = per_page
+        self._source = source
+        self._key = key
+        self._after = after
+        self._first = self._last = None
+        self._count = 0
+        self._more = False
+
+    @property
+    def rows(self) -> Iterator[Any]:
+        it = iter(self._source)
+        try:
+            for row in it:
+                if self._count == self.per_page:
+                    self._more = True
+                    break
+                if self._first is None:
+                    self._first = self._key(row)
+                self._last = self._key(row)
+                self._count += 1
+                yield row
+        finally:
+            close = getattr(it, "close", None)
+            if close:
+                close()  # devolve a conexão do cursor ao pool
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        return encode_cursor(*self._last) if self._more and self._last else None
+
+    @property
+    def prev_cursor(self) -> Optional[str]:
+        return encode_cursor(*self._first) if self._after and self._first else None
+
+
+def page_size(value: Optional[str], default: int = DEFAULT_PAGE_SIZE) -> int:
+    """Tamanho de página pedido (?per_page=), restrito a PAGE_SIZES."""
+    try:
+        n = int(value or default)
+    except ValueError:
+        return default
+    return n if n in PAGE_SIZES else default
+
+
+def encode_cursor(key_date: date, key_id: int) -> str:
+    raw = f"{key_date.isoformat()}|{int(key_id)}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Cursor]:
+    """Chave do cursor, ou None se vazio/inválido (volta à primeira página)."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        d, i = raw.split("|", 1)
+        return date.fromisoformat(d), int(i)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_where(where: str, params: dict, date_col: str, id_col: str,
+                 key: Optional[Cursor], op: str = "<") -> str:
+    """
+    Acrescenta "(date_col, id_col) op (cursor)" ao WHERE de uma listagem
+    (params nomeados: key_date/key_id). op "<" = depois do cursor na
+    ordem DESC; ">" = antes dele.
+    """
+    if not key:
+        return where
+    cond = f"({date_col}, {id_col}) {op} (%(key_date)s::date, %(key_id)s)"
+    params["key_date"], params["key_id"] = key
+    return f"{where} AND {cond}" if where else f"WHERE {cond}"
+
+
+def build_page(rows: list, per_page: int, key, after: bool, before: bool) -> Page:
+    """
+    Monta a Page a partir de até per_page+1 linhas já na ordem de exibição
+    (DESC). `key(row)` devolve (data, id). `after`/`before` dizem de onde
+    veio o pedido: "próxima" (ou primeira) página / página anterior, lida
+    em ordem ASC e invertida por quem chamou.
+    """
+    more = len(rows) > per_page
+    if before:
+        # a linha extra (mais recente) fica no início
+        rows = rows[1:] if more else rows
+        has_prev, has_next = more, True
+    else:
+        rows = rows[:per_page]
+        has_prev, has_next = after, more
+
+    page = Page(rows=rows, per_page=per_page)
+    if rows:
+        if has_next:
+            page.next_cursor = encode_cursor(*key(rows[-1]))
+        if has_prev:
+            page.prev_cursor = encode_cursor(*key(rows[0]))
+    return page
@@ -4,7 +4,45 @@ from datetime import date
 from ..db import get_conn
 
 
+# date_trunc -> passo do generate_series
+BUCKET_STEPS = {"day": "1 day", "week": "1 week", "month": "1 month", "quarter": "3 months"}
+
+# semente do TABLESAMPLE: a mesma amostra a cada pedido (estimativa estável)
+SAMPLE_SEED = 42
+
+# dimensões do relatório dinâmico (pivot): (chave, rótulo, JOINs necessários)
+PIVOT_DIMENSIONS: Dict[str, Tuple[str, str, str]] = {
+    "doctor": (
+        "p.doctor_user_id",
+        "COALESCE(NULLIF(d.full_name, ''), u.username)",
+        "LEFT JOIN users u ON u.id = p.doctor_user_id LEFT JOIN doctors d ON d.user_id = p.doctor_user_id",
+    ),
+    "hospital": (
+        "p.hospital_id",
+        "COALESCE(h.nickname, h.trade_name, h.corporate_name)",
+        "LEFT JOIN hospitals h ON h.id = p.hospital_id",
+    ),
+    "procedure": (
+        "p.procedure_id",
+        "COALESCE(pr.tuss_code || ' — ', '') || COALESCE(pr.name, '(sem nome)')",
+        "LEFT JOIN procedures pr ON pr.id = p.procedure_id",
+    ),
+    "month": (
+        "date_trunc('month', p.exec_date)::date",
+        "to_char(date_trunc('month', p.exec_date), 'MM/YYYY')",
+        "",
+    ),
+    "year": ("p.year", "p.year::text", ""),
+}
+
+
 class AnalyticsRepository:
+    """
+    Agregados dos dashboards. As somas leem production_rollup (productions
+    já somado por dia/médico/hospital/procedimento, ver
+    ProductionRollupRepository); só os lançamentos recentes vão em productions.
+    """
+
     # ---- helpers ------------------------------------------------------------
     def _where(
         self,
@@ -36,189 +74,287 @@ class AnalyticsRepository:
         where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
         return where, params
 
-    # ---- contagens "de cadastro" (não filtradas) ----------------------------
-    def totals(self) -> Dict[str, Any]:
-        sql = """
-        SELECT
-          (SELECT COUNT(*) FROM hospitals) AS hospitals,
-          (SELECT COUNT(*) FROM users WHERE role='doctor') AS doctors
-        """
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql)
-            return cur.fetchone()
-
-    # ---- total de procedimentos (FILTRADO) ---------------------------------
-    def total_procedures(
+    # ---- dashboard do admin numa consulta só (FILTRADO) ---------------------
+    def dashboard_summary(
         self,
-        date_from: Optional[str],
-        date_to: Optional[str],
-        hospital_id: Optional[int],
-        doctor_user_id: Optional[int],
-        procedure_id: Optional[int],
-    ) -> int:
-        where, params = self._where(date_from, date_to, hospital_id, doctor_user_id, procedure_id)
-        sql = f"SELECT COALESCE(SUM(p.quantity), 0)::int AS qty FROM productions p {where};"
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql, params)
-            row = cur.fetchone()
-            return int(row["qty"]) if row else 0
+        limit: int = 8,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        hospital_id: Optional[int] = None,
+        doctor_user_id: Optional[int] = None,
+        procedure_id: Optional[int] = None,
+        sample_percent: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Tudo o que o dashboard do admin mostra (contagens de cadastro, total
+        de procedimentos e rankings de médicos e hospitais, em quantidade e
+        em valor faturado = quantity * unit_price) numa ida ao banco: um
+        GROUPING SETS sobre uma única leitura filtrada do production_rollup
+        (total, por médico e por hospital), mais as contagens de cadastro.
+        A série temporal é o time_series().
 
-    # ---- série mensal (FILTRADA) -------------------------------------------
-    def monthly_production(
-        self,
-        date_from: Optional[str],
-        date_to: Optional[str],
-        hospital_id: Optional[int],
-        doctor_user_id: Optional[int],
-        procedure_id: Optional[int],
-    ) -> List[Dict[str, Any]]:
-        where, params = self._where(date_from, date_to, hospital_id, doctor_user_id, procedure_id)
+        Com `sample_percent` (ver sample_percent()), lê só essa fração dos
+        blocos do production_rollup (TABLESAMPLE SYSTEM, semente fixa) e
+        devolve estimativas: somas expandidas por 100/percentual e, em
+        qty_err/value_err, a margem de ~95% (1,96 erro-padrão). Como o
+        sorteio é por bloco, a variância usa as somas por bloco (estimador
+        de Horvitz-Thompson com probabilidade de inclusão f de cada bloco):
+        Var = (1 - f) / f² * Σ Y_bloco². No modo exato as margens são 0.
+        """
+        where, where_params = self._where(date_from, date_to, hospital_id, doctor_user_id, procedure_id)
 
-        # Se não veio período, restringe ao ano corrente
-        if not date_from and not date_to:
-            if where:
-                where += " AND EXTRACT(YEAR FROM p.exec_date) = %s"
-            else:
-                where = "WHERE EXTRACT(YEAR FROM p.exec_date) = %s"
-            params.append(date.today().year)
+        # GROUPING(doctor_user_id, hospital_id): bit ligado = coluna agregada
+        #   3 -> total | 1 -> por médico | 2 -> por hospital
+        # Rankings saem duas vezes: por quantidade e por valor faturado.
+        if sample_percent is None:
+            agg = f"""
+            agg AS (
+                SELECT GROUPING(p.doctor_user_id, p.hospital_id) AS gset,
+                       p.doctor_user_id, p.hospital_id,
+                       COALESCE(SUM(p.quantity), 0)::int AS qty,
+                       COALESCE(SUM(p.value), 0)::numeric(14,2) AS value,
+                       0::float8 AS qty_err,
+                       0::float8 AS value_err
+                  FROM production_rollup p
+                  {where}
+              GROUP BY GROUPING SETS ((), (p.doctor_user_id), (p.hospital_id))
+            )"""
+            agg_params = where_params
+        else:
+            # somas por bloco amostrado (mesmos grouping sets + número do
+            # bloco), depois expandidas por 1/f com a variância entre blocos
+            agg = f"""
+            k AS (SELECT %s::float8 / 100 AS f),
+            blocks AS (
+                SELECT GROUPING(doctor_user_id, hospital_id) AS gset,
+                       doctor_user_id, hospital_id,
+                       SUM(quantity)::float8 AS qty,
+                       SUM(value)::float8 AS value
+                  FROM (
+                        SELECT (p.ctid::text::point)[0]::bigint AS blk,
+                               p.doctor_user_id, p.hospital_id, p.quantity, p.value
+                          FROM production_rollup p TABLESAMPLE SYSTEM (%s) REPEATABLE (%s)
+                          {where}
+                       ) f
+              GROUP BY blk, GROUPING SETS ((), (doctor_user_id), (hospital_id))
+            ),
+            agg AS (
+                SELECT b.gset, b.doctor_user_id, b.hospital_id,
+                       ROUND(SUM(b.qty) / k.f)::int AS qty,
+                       (SUM(b.value) / k.f)::numeric(14,2) AS value,
+                       1.96 * sqrt((1 - k.f) * SUM(b.qty * b.qty)) / k.f AS qty_err,
+                       1.96 * sqrt((1 - k.f) * SUM(b.value * b.value)) / k.f AS value_err
+                  FROM blocks b CROSS JOIN k
+              GROUP BY b.gset, b.doctor_user_id, b.hospital_id, k.f
+            )"""
+            agg_params = [sample_percent, sample_percent, SAMPLE_SEED] + where_params
 
         sql = f"""
-            SELECT EXTRACT(MONTH FROM p.exec_date)::int AS m,
-                   COALESCE(SUM(p.quantity),0)::int AS qty
-              FROM productions p
-              {where}
-          GROUP BY 1
-          ORDER BY 1;
+            WITH {agg},
+            doctors_agg AS (
+                SELECT COALESCE(d.full_name, u.username) AS name, a.qty, a.value, a.qty_err, a.value_err
+                  FROM agg a
+                  JOIN users u   ON u.id = a.doctor_user_id
+             LEFT JOIN doctors d ON d.user_id = u.id
+                 WHERE a.gset = 1
+            ),
+            hospitals_agg AS (
+                SELECT COALESCE(h.nickname, h.trade_name, h.corporate_name) AS name, a.qty, a.value, a.qty_err, a.value_err
+                  FROM agg a
+                  JOIN hospitals h ON h.id = a.hospital_id
+                 WHERE a.gset = 2
+            )
+            SELECT 'total' AS kind, NULL::text AS name, qty, value, qty_err, value_err
+              FROM agg WHERE gset = 3
+            UNION ALL
+            (SELECT 'doctor', name, qty, value, qty_err, value_err FROM doctors_agg ORDER BY qty DESC LIMIT %s)
+            UNION ALL
+            (SELECT 'doctor_value', name, qty, value, qty_err, value_err FROM doctors_agg ORDER BY value DESC LIMIT %s)
+            UNION ALL
+            (SELECT 'hospital', name, qty, value, qty_err, value_err FROM hospitals_agg ORDER BY qty DESC LIMIT %s)
+            UNION ALL
+            (SELECT 'hospital_value', name, qty, value, qty_err, value_err FROM hospitals_agg ORDER BY value DESC LIMIT %s)
+            UNION ALL
+            SELECT 'hospitals', NULL, (SELECT COUNT(*) FROM hospitals)::int, NULL, NULL, NULL
+            UNION ALL
+            SELECT 'doctors', NULL, (SELECT COUNT(*) FROM users WHERE role='doctor')::int, NULL, NULL, NULL;
         """
-        with get_conn() as conn, conn.cursor() as cur:
+        params = agg_params + [limit] * 4
+
+        out: Dict[str, Any] = {
+            "totals": {"hospitals": 0, "doctors": 0},
+            "procedures": 0,
+            "value": 0,
+            "procedures_err": 0.0,
+            "value_err": 0.0,
+            "sample_percent": sample_percent,
+            "top_doctors": [],
+            "top_hospitals": [],
+            "top_doctors_value": [],
+            "top_hospitals_value": [],
+        }
+        lists = {
+            "doctor": "top_doctors",
+            "hospital": "top_hospitals",
+            "doctor_value": "top_doctors_value",
+            "hospital_value": "top_hospitals_value",
+        }
+        with get_conn(readonly=True) as conn, conn.cursor() as cur:
             cur.execute(sql, params)
-            return cur.fetchall()
+            for kind, name, qty, value, qty_err, value_err in cur.fetchall():
+                err = {"qty_err": qty_err or 0.0, "value_err": value_err or 0.0}
+                if kind == "total":
+                    out["procedures"] = int(qty)
+                    out["value"] = value
+                    out["procedures_err"], out["value_err"] = err["qty_err"], err["value_err"]
+                elif kind in lists:
+                    out[lists[kind]].append({"name": name, "qty": qty, "value": value, **err})
+                else:
+                    out["totals"][kind] = int(qty)
 
-    # ---- ranking por médico (FILTRADO) -------------------------------------
-    def top_doctors(
+        # UNION ALL não garante ordem: reordena como os métodos separados
+        out["top_doctors"].sort(key=lambda r: r["qty"], reverse=True)
+        out["top_hospitals"].sort(key=lambda r: r["qty"], reverse=True)
+        out["top_doctors_value"].sort(key=lambda r: r["value"], reverse=True)
+        out["top_hospitals_value"].sort(key=lambda r: r["value"], reverse=True)
+        return out
+
+    def sample_percent(self, target_rows: int) -> Optional[float]:
+        """
+        Percentual de amostragem do production_rollup que lê ~target_rows
+        linhas, pela estimativa do planner (pg_class.reltuples). None quando
+        a tabela inteira já cabe nisso (ou nunca foi analisada): aí a conta
+        exata é tão barata quanto a amostra.
+        """
+        with get_conn(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute("SELECT reltuples FROM pg_class WHERE oid = 'production_rollup'::regclass;")
+            row = cur.fetchone()
+        total = float(row[0]) if row else 0.0
+        if total <= target_rows:
+            return None
+        return round(max(100.0 * target_rows / total, 0.01), 2)
+
+    # ---- série temporal por balde + ano anterior (FILTRADA) ------------------
+    def time_series(
         self,
-        limit: int = 8,
-        date_from: Optional[str] = None,
-        date_to: Optional[str] = None,
+        start: date,
+        end: date,
+        bucket: str,
         hospital_id: Optional[int] = None,
         doctor_user_id: Optional[int] = None,
         procedure_id: Optional[int] = None,
     ) -> List[Dict[str, Any]]:
-        where, params = self._where(date_from, date_to, hospital_id, doctor_user_id, procedure_id)
-        params.append(limit)
+        """
+        Quantidade e valor por balde (date_trunc `bucket`: day/week/month/
+        quarter) em [start, end), com o mesmo balde do ano anterior ao lado
+        (prev_qty/prev_value). Todos os baldes do intervalo aparecem, mesmo
+        sem lançamentos (generate_series).
+        """
+        step = BUCKET_STEPS[bucket]
+        where, wparams = self._where(None, None, hospital_id, doctor_user_id, procedure_id)
+        extra = where.replace("WHERE ", "AND ", 1)
+
         sql = f"""
-            SELECT COALESCE(d.full_name, u.username) AS name,
-                   COALESCE(SUM(p.quantity),0)::int AS qty
-              FROM productions p
-              JOIN users u        ON u.id = p.doctor_user_id
-         LEFT JOIN doctors d      ON d.user_id = u.id
-              {where}
-          GROUP BY 1
-          ORDER BY qty DESC
-          LIMIT %s;
+            WITH buckets AS (
+                SELECT g::date AS b
+                  FROM generate_series(date_trunc(%s, %s::timestamp),
+                                       %s::timestamp - interval '1 day',
+                                       %s::interval) AS g
+            ),
+            cur AS (
+                SELECT date_trunc(%s, p.exec_date::timestamp)::date AS b,
+                       SUM(p.quantity)::int AS qty,
+                       SUM(p.value) AS value
+                  FROM production_rollup p
+                 WHERE p.exec_date >= %s AND p.exec_date < %s {extra}
+              GROUP BY 1
+            ),
+            prev AS (
+                SELECT date_trunc(%s, (p.exec_date + interval '1 year'))::date AS b,
+                       SUM(p.quantity)::int AS qty,
+                       SUM(p.value) AS value
+                  FROM production_rollup p
+                 WHERE p.exec_date >= (%s::date - interval '1 year')
+                   AND p.exec_date <  (%s::date - interval '1 year') {extra}
+              GROUP BY 1
+            )
+            SELECT b.b AS bucket,
+                   COALESCE(cur.qty, 0)    AS qty,
+                   COALESCE(cur.value, 0)  AS value,
+                   COALESCE(prev.qty, 0)   AS prev_qty,
+                   COALESCE(prev.value, 0) AS prev_value
+              FROM buckets b
+         LEFT JOIN cur  ON cur.b = b.b
+         LEFT JOIN prev ON prev.b = b.b
+          ORDER BY 1;
         """
-        with get_conn() as conn, conn.cursor() as cur:
+        params = (
+            [bucket, start, end, step]
+            + [bucket, start, end] + wparams
+            + [bucket, start, end] + wparams
+        )
+        with get_conn(readonly=True) as conn, conn.cursor() as cur:
             cur.execute(sql, params)
             return cur.fetchall()
 
-    # ---- ranking por hospital (FILTRADO) -----------------------------------
-    def top_hospitals(
+    # ---- relatório dinâmico: duas dimensões, um GROUP BY (FILTRADO) ----------
+    def pivot(
         self,
-        limit: int = 8,
+        rows: str,
+        cols: str,
         date_from: Optional[str] = None,
         date_to: Optional[str] = None,
         hospital_id: Optional[int] = None,
         doctor_user_id: Optional[int] = None,
         procedure_id: Optional[int] = None,
     ) -> List[Dict[str, Any]]:
+        """
+        Células (r_key, r_label, c_key, c_label, qty, value) do cruzamento
+        `rows` x `cols` (chaves de PIVOT_DIMENSIONS), somadas no
+        production_rollup; o formato de matriz é montado por quem chama.
+        """
+        if rows not in PIVOT_DIMENSIONS or cols not in PIVOT_DIMENSIONS or rows == cols:
+            raise ValueError("Dimensões inválidas para o relatório.")
+        r_key, r_label, r_join = PIVOT_DIMENSIONS[rows]
+        c_key, c_label, c_join = PIVOT_DIMENSIONS[cols]
         where, params = self._where(date_from, date_to, hospital_id, doctor_user_id, procedure_id)
-        params.append(limit)
+
         sql = f"""
-            SELECT COALESCE(h.nickname, h.trade_name, h.corporate_name) AS name,
-                   COALESCE(SUM(p.quantity),0)::int AS qty
-              FROM productions p
-              JOIN hospitals h ON h.id = p.hospital_id
+            SELECT {r_key} AS r_key, {r_label} AS r_label,
+                   {c_key} AS c_key, {c_label} AS c_label,
+                   SUM(p.quantity)::int AS qty,
+                   SUM(p.value)         AS value
+              FROM production_rollup p
+              {r_join}
+              {c_join}
               {where}
-          GROUP BY 1
-          ORDER BY qty DESC
-          LIMIT %s;
+          GROUP BY 1, 2, 3, 4;
         """
-        with get_conn() as conn, conn.cursor() as cur:
+        with get_conn(readonly=True) as conn, conn.cursor() as cur:
             cur.execute(sql, params)
             return cur.fetchall()
 
-    def hospitals_for_doctor(self, user_id: int) -> List[Dict[str, Any]]:
+    # ---- opções dos filtros do dashboard (cadastros) -------------------------
+    def filter_options(self) -> Dict[str, Any]:
+        """Hospitais, médicos e procedimentos ativos ({id, name}) numa consulta só."""
         sql = """
-        SELECT h.id,
-               COALESCE(h.nickname, h.trade_name, h.corporate_name) AS name
-          FROM doctor_hospitals dh
-          JOIN hospitals h ON h.id = dh.hospital_id
-         WHERE dh.user_id = %s
-         ORDER BY name;
-        """
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
-            return cur.fetchall()
-
-    def doctor_procedures_total(self, user_id: int) -> int:
-        sql = """
-        SELECT COALESCE(SUM(quantity),0)::int AS qty
-          FROM productions
-         WHERE doctor_user_id = %s;
+        SELECT
+          (SELECT COALESCE(json_agg(x ORDER BY x.id DESC), '[]')
+             FROM (SELECT id, COALESCE(nickname, trade_name, corporate_name) AS name
+                     FROM hospitals) x) AS hospitals,
+          (SELECT COALESCE(json_agg(x ORDER BY x.id DESC), '[]')
+             FROM (SELECT u.id, COALESCE(d.full_name, u.username) AS name
+                     FROM users u
+                LEFT JOIN doctors d ON d.user_id = u.id
+                    WHERE u.role = 'doctor') x) AS doctors,
+          (SELECT COALESCE(json_agg(x ORDER BY x.id DESC), '[]')
+             FROM (SELECT id, name FROM procedures WHERE active) x) AS procedures;
         """
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
+        with get_conn(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(sql)
             row = cur.fetchone()
-            return row["qty"] if row else 0
-
-    def doctor_procedures_breakdown(self, user_id: int, limit: int = 30) -> List[Dict[str, Any]]:
-        sql = """
-        SELECT COALESCE(p.name, '(sem nome)') AS name,
-               p.tuss_code,
-               SUM(pr.quantity)::int AS qty
-          FROM productions pr
-          LEFT JOIN procedures p ON p.id = pr.procedure_id
-         WHERE pr.doctor_user_id = %s
-         GROUP BY 1,2
-         ORDER BY qty DESC
-         LIMIT %s;
-        """
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id, limit))
-            return cur.fetchall()
-
-    def doctor_monthly_production(self, user_id: int, year: int) -> List[Dict[str, Any]]:
-        sql = """
-        SELECT EXTRACT(MONTH FROM exec_date)::int AS m,
-               SUM(quantity)::int AS qty
-          FROM productions
-         WHERE doctor_user_id = %s
-           AND EXTRACT(YEAR FROM exec_date) = %s
-         GROUP BY 1
-         ORDER BY 1;
-        """
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id, year))
-            return cur.fetchall()
-
-    def recent_productions_for_doctor(self, doctor_user_id: int, limit: int = 5) -> List[Dict[str, Any]]:
-        """
-        Últimos lançamentos do médico (ordenado por data de execução, depois id).
-        Ajuste o ORDER BY para created_at DESC se sua tabela tiver essa coluna.
-        """
-        sql = """
-          SELECT p.id,
-                 p.exec_date::date AS exec_date,
-                 p.quantity::int   AS quantity,
-                 COALESCE(h.nickname, h.trade_name, h.corporate_name) AS hospital_name,
-                 pr.name AS procedure_name
-            FROM productions p
-            JOIN hospitals  h ON h.id = p.hospital_id
-            JOIN procedures pr ON pr.id = p.procedure_id
-           WHERE p.doctor_user_id = %(uid)s
-           ORDER BY p.exec_date DESC, p.id DESC
-           LIMIT %(limit)s;
-        """
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql, {"uid": doctor_user_id, "limit": limit})
-            return cur.fetchall()
\ No newline at end of file
+            return {
+                "hospitals": row["hospitals"],
+                "doctors": row["doctors"],
+                "procedures": row["procedures"],
+            }
@@ -0,0 +1,70 @@
+# app/repositories/data_versions.py
+from typing import Iterable, Optional, Tuple
+from datetime import datetime
+from ..db import get_conn, after_commit
+
+
+def bump(cur, *names: str) -> None:
+    """
+    Incrementa a versão dos conjuntos de dados `names` na transação do
+    cursor (cadastros chamam junto com a escrita; lançamentos usam
+    bump_after_commit):
+      "productions" -> lançamentos (rollup, dashboards)
+      "registry"    -> cadastros que aparecem nos painéis (hospitais,
+                       usuários/médicos, procedimentos)
+    """
+    if not names:
+        return
+    cur.execute(
+        """
+        INSERT INTO data_versions AS v (name, version, updated_at)
+        SELECT n, 1, now() FROM unnest(%s::text[]) AS n
+        ORDER BY n
+        ON CONFLICT (name) DO UPDATE
+           SET version = v.version + 1,
+               updated_at = now();
+        """,
+        (sorted(set(names)),),
+    )
+
+
+def bump_after_commit(*names: str) -> None:
+    """
+    bump() numa transação própria, logo depois do commit de quem gravou
+    (ver db.after_commit): para escritas frequentes (lançamentos), que não
+    devem ficar enfileiradas no lock da linha de data_versions até o
+    commit. A versão muda depois que os dados já estão visíveis.
+    """
+    after_commit(lambda cur: bump(cur, *names))
+
+
+class DataVersionRepository:
+    """
+    Versão (contador + instante da última escrita) de cada conjunto de
+    dados; base dos ETag/Last-Modified dos painéis JSON do dashboard.
+    """
+
+    DDL = """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name       text        PRIMARY KEY,
+            version    bigint      NOT NULL DEFAULT 0,
+            updated_at timestamptz NOT NULL DEFAULT now()
+        );
+    """
+
+    def current(self, names: Iterable[str]) -> Tuple[str, Optional[datetime]]:
+        """
+        ("productions:12;registry:3", última alteração) dos conjuntos pedidos.
+        Lê da réplica, como os painéis: os dados servidos nunca são mais
+        velhos que a versão que vai no ETag.
+        """
+        names = sorted(set(names))
+        with get_conn(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT name, version, updated_at FROM data_versions WHERE name = ANY(%s);",
+                (names,),
+            )
+            rows = {r["name"]: r for r in cur.fetchall()}
+        tag = ";".join(f"{n}:{rows[n]['version'] if n in rows else 0}" for n in names)
+        modified = [r["updated_at"] for r in rows.values()]
+        return tag, (max(modified) if modified else None)
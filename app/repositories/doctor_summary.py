@@ -0,0 +1,232 @@
+# app/repositories/doctor_summary.py
+from typing import Any, Dict, Iterable, Optional, Sequence
+from collections import defaultdict
+from datetime import date
+from psycopg2.extras import Json, execute_values
+from ..db import get_conn
+
+BREAKDOWN_LIMIT = 30  # procedimentos no ranking do médico
+RECENT_LIMIT = 5      # últimos lançamentos mostrados
+
+
+class DoctorSummaryRepository:
+    """
+    doctor_summary: uma linha por médico com os números do dashboard dele
+    (total, quantidade por procedimento, série mensal do ano e ids dos
+    últimos lançamentos), para o dashboard ser uma leitura por chave
+    primária.
+
+    Só ids e quantidades ficam gravados: os nomes de procedimentos e
+    hospitais (e os hospitais vinculados) entram na leitura, então uma
+    renomeação no cadastro aparece na hora.
+
+    apply(cur, linhas, sign) soma/subtrai os lançamentos gravados
+    (RETURNING ROLLUP_RETURNING) na mesma transação da escrita, como o
+    production_rollup; só a lista curta de recentes é relida (índice
+    productions (doctor_user_id, exec_date DESC, id DESC)). refresh()
+    recalcula do rollup: linha ausente, virada de ano ou reparo.
+    """
+
+    DDL = """
+        CREATE TABLE IF NOT EXISTS doctor_summary (
+            user_id          integer     PRIMARY KEY,
+            year             smallint    NOT NULL,
+            procedures_total bigint      NOT NULL DEFAULT 0,
+            procedures       jsonb       NOT NULL DEFAULT '{}',  -- {procedure_id: qty}
+            monthly          integer[]   NOT NULL,
+            recent_ids       integer[]   NOT NULL DEFAULT '{}',
+            updated_at       timestamptz NOT NULL DEFAULT now()
+        );
+    """
+
+    # ids dos últimos lançamentos do médico `{uid}` (coluna da consulta externa)
+    _RECENT_IDS_SQL = (
+        "ARRAY(SELECT p.id FROM productions p WHERE p.doctor_user_id = {uid}"
+        f" ORDER BY p.exec_date DESC, p.id DESC LIMIT {RECENT_LIMIT})"
+    )
+
+    _REFRESH_SQL = f"""
+        INSERT INTO doctor_summary AS s
+               (user_id, year, procedures_total, procedures, monthly, recent_ids, updated_at)
+        SELECT u.id,
+               %(year)s,
+               COALESCE((SELECT SUM(r.quantity)
+                           FROM production_rollup r
+                          WHERE r.doctor_user_id = u.id), 0),
+               COALESCE((SELECT jsonb_object_agg(b.procedure_id, b.qty)
+                           FROM (SELECT r.procedure_id, SUM(r.quantity) AS qty
+                                   FROM production_rollup r
+                                  WHERE r.doctor_user_id = u.id
+                               GROUP BY 1
+                                 HAVING SUM(r.quantity) <> 0) b), '{{}}'),
+               ARRAY(SELECT COALESCE(SUM(r.quantity), 0)::int
+                       FROM generate_series(1, 12) AS g(m)
+                  LEFT JOIN production_rollup r
+                         ON r.doctor_user_id = u.id
+                        AND r.exec_date >= %(year_start)s AND r.exec_date < %(year_end)s
+                        AND r.month = g.m
+                   GROUP BY g.m
+                   ORDER BY g.m),
+               {_RECENT_IDS_SQL.format(uid="u.id")},
+               now()
+          FROM users u
+         WHERE u.id = ANY(%(ids)s)
+        ON CONFLICT (user_id) DO UPDATE
+           SET year             = EXCLUDED.year,
+               procedures_total = EXCLUDED.procedures_total,
+               procedures       = EXCLUDED.procedures,
+               monthly          = EXCLUDED.monthly,
+               recent_ids       = EXCLUDED.recent_ids,
+               updated_at       = EXCLUDED.updated_at;
+    """
+
+    # d.procedures: {procedure_id: delta}; d.monthly: deltas do ano da linha
+    _APPLY_SQL = f"""
+        UPDATE doctor_summary AS s
+           SET procedures_total = s.procedures_total + d.total,
+               procedures = (
+                   SELECT COALESCE(jsonb_object_agg(k, q), '{{}}')
+                     FROM (SELECT k, SUM(q) AS q
+                             FROM (SELECT key AS k, value::bigint AS q FROM jsonb_each_text(s.procedures)
+                                   UNION ALL
+                                   SELECT key, value::bigint FROM jsonb_each_text(d.procedures)) x
+                         GROUP BY k
+                           HAVING SUM(q) <> 0) m),
+               monthly = ARRAY(SELECT s.monthly[g] + d.monthly[g]
+                                 FROM generate_series(1, 12) AS g
+                             ORDER BY g),
+               recent_ids = {_RECENT_IDS_SQL.format(uid="s.user_id")},
+               updated_at = now()
+          FROM (VALUES %s) AS d(user_id, total, procedures, monthly)
+         WHERE s.user_id = d.user_id;
+    """
+
+    _READ_SQL = """
+        SELECT s.year, s.procedures_total, s.monthly,
+               COALESCE((SELECT jsonb_agg(b ORDER BY b.qty DESC)
+                           FROM (SELECT COALESCE(p.name, '(sem nome)') AS name,
+                                        p.tuss_code,
+                                        t.value::int AS qty
+                                   FROM jsonb_each_text(s.procedures) t
+                              LEFT JOIN procedures p ON p.id = t.key::int
+                               ORDER BY qty DESC
+                                  LIMIT %(breakdown_limit)s) b), '[]') AS breakdown,
+               COALESCE((SELECT jsonb_agg(x ORDER BY x.exec_date DESC, x.id DESC)
+                           FROM (SELECT p.id,
+                                        p.exec_date::date AS exec_date,
+                                        p.quantity::int   AS quantity,
+                                        COALESCE(h.nickname, h.trade_name, h.corporate_name) AS hospital_name,
+                                        pr.name AS procedure_name
+                                   FROM productions p
+                                   JOIN hospitals  h ON h.id = p.hospital_id
+                                   JOIN procedures pr ON pr.id = p.procedure_id
+                                  WHERE p.id = ANY(s.recent_ids)) x), '[]') AS recent,
+               COALESCE((SELECT jsonb_agg(y ORDER BY y.name)
+                           FROM (SELECT h.id,
+                                        COALESCE(h.nickname, h.trade_name, h.corporate_name) AS name
+                                   FROM doctor_hospitals dh
+                                   JOIN hospitals h ON h.id = dh.hospital_id
+                                  WHERE dh.user_id = s.user_id) y), '[]') AS hospitals
+          FROM doctor_summary s
+         WHERE s.user_id = %(uid)s;
+    """
+
+    def apply(self, cur, rows: Iterable[Sequence], sign: int = 1) -> None:
+        """
+        Soma (sign=1) ou subtrai (sign=-1) lançamentos dos resumos, no cursor
+        (transação) de quem gravou em productions, depois do rollup.
+        Cada linha na ordem de ROLLUP_RETURNING: (exec_date, doctor_user_id,
+        hospital_id, procedure_id, quantity, unit_price).
+
+        A linha do médico fica travada (FOR UPDATE) até o commit: escritas
+        simultâneas do mesmo médico somam em sequência. Médico sem resumo
+        (ou de outro ano) é recalculado do rollup, que já inclui esta escrita.
+        """
+        sign = 1 if sign >= 0 else -1
+        year = date.today().year
+        deltas: Dict[int, Dict[str, Any]] = {}
+        for exec_date, uid, _hid, pid, qty, _price in (tuple(r)[:6] for r in rows):
+            d = deltas.setdefault(int(uid), {
+                "total": 0, "procedures": defaultdict(int), "monthly": [0] * 12,
+            })
+            q = sign * int(qty or 0)
+            d["total"] += q
+            d["procedures"][str(pid)] += q
+            if exec_date.year == year:
+                d["monthly"][exec_date.month - 1] += q
+        if not deltas:
+            return
+
+        ids = sorted(deltas)
+        cur.execute(
+            "SELECT user_id, year FROM doctor_summary WHERE user_id = ANY(%s) "
+            "ORDER BY user_id FOR UPDATE;",
+            (ids,),
+        )
+        current = {r[0] for r in cur.fetchall() if r[1] == year}
+        stale = [uid for uid in ids if uid not in current]
+        if stale:
+            self.refresh(cur, stale)
+        if current:
+            execute_values(
+                cur,
+                self._APPLY_SQL,
+                [
+                    (uid, d["total"], Json(dict(d["procedures"])), d["monthly"])
+                    for uid, d in sorted(deltas.items()) if uid in current
+                ],
+                template="(%s::int, %s::bigint, %s::jsonb, %s::int[])",
+            )
+
+    def refresh(self, cur, user_ids: Iterable[int]) -> None:
+        """
+        Recalcula do production_rollup o resumo dos médicos informados, no
+        cursor (transação) de quem chamou. Um advisory lock por médico
+        serializa quem recalcula a mesma linha ainda inexistente: o
+        recálculo só começa depois do commit do anterior e enxerga o que
+        ele gravou.
+        """
+        ids = sorted({int(i) for i in user_ids if i is not None})
+        if not ids:
+            return
+        cur.execute(
+            "SELECT pg_advisory_xact_lock(hashtext('doctor_summary'), uid) FROM unnest(%s) AS uid;",
+            (ids,),
+        )
+        year = date.today().year
+        cur.execute(self._REFRESH_SQL, {
+            "ids": ids,
+            "year": year,
+            "year_start": date(year, 1, 1),
+            "year_end": date(year + 1, 1, 1),
+        })
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Resumo do médico (leitura por chave primária, com os nomes atuais
+        do cadastro). Se ainda não existe ou é de um ano anterior,
+        recalcula e devolve o novo.
+
+        Lê do primário, como o histórico da mesma tela: o médico que acabou
+        de lançar vê o lançamento no dashboard (a réplica pode estar atrás).
+        """
+        params = {"uid": user_id, "breakdown_limit": BREAKDOWN_LIMIT}
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(self._READ_SQL, params)
+            row = cur.fetchone()
+        if row is not None and row["year"] == date.today().year:
+            return row
+
+        with get_conn() as conn, conn.cursor() as cur:
+            self.refresh(cur, [user_id])
+            cur.execute(self._READ_SQL, params)
+            return cur.fetchone()
+
+    def rebuild(self) -> int:
+        """Recalcula o resumo de todos os médicos. Retorna quantos."""
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(self.DDL)
+            cur.execute("SELECT id FROM users WHERE role = 'doctor' ORDER BY id;")
+            ids = [r[0] for r in cur.fetchall()]
+            self.refresh(cur, ids)
+            return len(ids)
@@ -1,6 +1,7 @@
 # app/repositories/doctors.py
 from typing import Optional, Dict, Any, List
-from ..db import get_conn
+from ..db import get_conn, execute_prepared
+from .data_versions import bump as bump_version
 
 class DoctorRepository:
     def upsert(self, user_id: int, doc: Dict[str, Any]) -> None:
@@ -51,10 +52,12 @@ class DoctorRepository:
                     doc.get("company_crm"),
                 ),
             )
+            bump_version(cur, "registry")  # nome do médico aparece nos rankings
 
     def delete(self, user_id: int) -> None:
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute("DELETE FROM doctors WHERE user_id=%s;", (user_id,))
+            bump_version(cur, "registry")
 
     def get(self, user_id: int) -> Optional[Dict[str, Any]]:
         """
@@ -80,7 +83,7 @@ class DoctorRepository:
     def list_hospital_ids(self, user_id: int) -> List[int]:
         sql = "SELECT hospital_id FROM doctor_hospitals WHERE user_id=%s ORDER BY hospital_id;"
         with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
+            execute_prepared(cur, "doctor_hospital_ids", sql, (user_id,))
             rows = cur.fetchall()
             # rows podem ser dicts ou tuplas, dependendo do cursor
             try:
@@ -1,8 +1,29 @@
 # app/repositories/expenses.py
-from typing import List, Dict, Any, Optional
-from ..db import get_conn
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from ..db import get_conn, iter_query, copy_csv, TupleCursor
+from ..models import ExpenseRow, ExpenseFilesRow
+from ..pagination import Page, Cursor, build_page, keyset_where, DEFAULT_PAGE_SIZE
 
 class ExpensesRepository:
+    # histórico do médico e listagem do admin, paginados por (request_date, id);
+    # CONCURRENTLY para não travar gravações (`flask db init`)
+    INDEXES = (
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS expenses_doctor_date_idx"
+        " ON expenses (doctor_user_id, request_date DESC, id DESC)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS expenses_date_id_idx"
+        " ON expenses (request_date DESC, id DESC)",
+    )
+
+    def ensure_indexes(self) -> None:
+        with get_conn() as conn:
+            conn.autocommit = True  # CREATE INDEX CONCURRENTLY não roda em transação
+            try:
+                with conn.cursor() as cur:
+                    for ddl in self.INDEXES:
+                        cur.execute(ddl)
+            finally:
+                conn.autocommit = False
+
     def insert_many(self, rows: List[Dict[str, Any]]) -> int:
         if not rows:
             return 0
@@ -18,14 +39,13 @@ class ExpensesRepository:
             cur.executemany(sql, rows)
             return cur.rowcount
 
-    def list(
+    def _filters(
         self,
         doctor_user_id: Optional[int] = None,
         date_from: Optional[str] = None,
         date_to: Optional[str] = None,
         city_like: Optional[str] = None,
-        limit: int = 500
-    ) -> List[Dict[str, Any]]:
+    ) -> Tuple[str, Dict[str, Any]]:
         wh: List[str] = []
         params: Dict[str, Any] = {}
 
@@ -43,6 +63,18 @@ class ExpensesRepository:
             params["city_like"] = f"%{city_like}%"
 
         where = f"WHERE {' AND '.join(wh)}" if wh else ""
+        return where, params
+
+    def list(
+        self,
+        doctor_user_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        city_like: Optional[str] = None,
+        limit: int = 500,
+        readonly: bool = True,
+    ) -> List[ExpenseRow]:
+        where, params = self._filters(doctor_user_id, date_from, date_to, city_like)
         sql = f"""
             SELECT e.id, e.request_date, e.city, e.amount, e.description,
                    u.id AS doctor_id, u.username, COALESCE(d.full_name,'') AS doctor_name
@@ -54,9 +86,126 @@ class ExpensesRepository:
              LIMIT %(limit)s;
         """
         params["limit"] = max(1, min(limit, 5000))
-        with get_conn() as conn, conn.cursor() as cur:
+        with get_conn(readonly=readonly) as conn, conn.cursor(cursor_factory=TupleCursor) as cur:
+            cur.execute(sql, params)
+            return ExpenseRow.from_rows(cur)
+
+    def page(
+        self,
+        doctor_user_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        city_like: Optional[str] = None,
+        after: Optional[Cursor] = None,
+        per_page: int = DEFAULT_PAGE_SIZE,
+        readonly: bool = True,
+    ) -> Page:
+        """
+        Página do list() por chave (request_date, id): as per_page linhas
+        depois do cursor `after` (rolagem infinita), lidas pelo índice de
+        expenses em (doctor_user_id, request_date DESC, id DESC).
+        """
+        where, params = self._filters(doctor_user_id, date_from, date_to, city_like)
+        where = keyset_where(where, params, "e.request_date", "e.id", after)
+        sql = f"""
+            SELECT e.id, e.request_date, e.city, e.amount, e.description,
+                   u.id AS doctor_id, u.username, COALESCE(d.full_name,'') AS doctor_name
+              FROM expenses e
+              JOIN users u        ON u.id = e.doctor_user_id
+              LEFT JOIN doctors d ON d.user_id = e.doctor_user_id
+              {where}
+             ORDER BY e.request_date DESC, e.id DESC
+             LIMIT %(limit)s;
+        """
+        params["limit"] = per_page + 1
+        with get_conn(readonly=readonly) as conn, conn.cursor(cursor_factory=TupleCursor) as cur:
+            cur.execute(sql, params)
+            rows = ExpenseRow.from_rows(cur)
+        return build_page(rows, per_page, lambda r: (r.request_date, r.id),
+                          after=bool(after), before=False)
+
+    def iter_list(
+        self,
+        doctor_user_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        city_like: Optional[str] = None,
+        limit: int = 500,
+    ) -> Iterator[ExpenseFilesRow]:
+        """
+        Mesmas linhas/filtros do list(), com os comprovantes de cada despesa
+        (files: [{id, orig_name}]) na própria linha, lidas por cursor
+        server-side — para a listagem do admin em streaming, sem uma
+        consulta de arquivos por despesa.
+        """
+        where, params = self._filters(doctor_user_id, date_from, date_to, city_like)
+        sql = f"""
+            SELECT e.id, e.request_date, e.city, e.amount, e.description,
+                   u.id AS doctor_id, u.username, COALESCE(d.full_name,'') AS doctor_name,
+                   COALESCE(f.files, '[]'::json) AS files
+              FROM expenses e
+              JOIN users u        ON u.id = e.doctor_user_id
+              LEFT JOIN doctors d ON d.user_id = e.doctor_user_id
+              LEFT JOIN LATERAL (
+                    SELECT json_agg(json_build_object('id', ef.id, 'orig_name', ef.orig_name)
+                                    ORDER BY ef.id) AS files
+                      FROM expense_files ef
+                     WHERE ef.expense_id = e.id
+              ) f ON true
+              {where}
+             ORDER BY e.request_date DESC, e.id DESC
+             LIMIT %(limit)s
+        """
+        params["limit"] = max(1, min(limit, 5000))
+        return iter_query(sql, params, readonly=True, row_type=ExpenseFilesRow)
+
+    def totals(
+        self,
+        doctor_user_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        city_like: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Quantidade de despesas e soma dos valores dos filtros do list()."""
+        where, params = self._filters(doctor_user_id, date_from, date_to, city_like)
+        sql = f"""
+            SELECT COUNT(*) AS entries, COALESCE(SUM(e.amount), 0) AS total
+              FROM expenses e
+              {where};
+        """
+        with get_conn(readonly=True) as conn, conn.cursor() as cur:
             cur.execute(sql, params)
-            return cur.fetchall()
+            return dict(cur.fetchone())
+
+    def copy_csv(
+        self,
+        doctor_user_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        city_like: Optional[str] = None,
+        gzip: bool = False,
+    ) -> Iterator[bytes]:
+        """
+        CSV (blocos de bytes) das despesas dos filtros do list(), sem
+        limite, via COPY ... TO STDOUT (ver db.copy_csv); os comprovantes
+        entram só como contagem.
+        """
+        where, params = self._filters(doctor_user_id, date_from, date_to, city_like)
+        sql = f"""
+            SELECT e.request_date                                AS "Data",
+                   COALESCE(NULLIF(d.full_name,''), u.username)  AS "Médico",
+                   e.city                                        AS "Cidade",
+                   e.amount                                      AS "Valor (R$)",
+                   e.description                                 AS "Descrição",
+                   (SELECT COUNT(*) FROM expense_files ef
+                     WHERE ef.expense_id = e.id)                 AS "Comprovantes"
+              FROM expenses e
+              JOIN users u        ON u.id = e.doctor_user_id
+              LEFT JOIN doctors d ON d.user_id = e.doctor_user_id
+              {where}
+             ORDER BY e.request_date DESC, e.id DESC
+        """
+        return copy_csv(sql, params, readonly=True, gzip=gzip)
 
     def delete_own(self, expense_id: int, doctor_user_id: int) -> bool:
         with get_conn() as conn, conn.cursor() as cur:
@@ -1,9 +1,10 @@
 # app/repositories/hospital_prices.py
 from typing import List, Dict, Any, Optional
-from ..db import get_conn
+from ..db import get_conn, execute_prepared, TupleCursor
+from ..models import PriceRow, ProcedurePriceRow
 
 class HospitalPriceRepository:
-    def list_for_hospital(self, hospital_id: int) -> List[Dict[str, Any]]:
+    def list_for_hospital(self, hospital_id: int) -> List[PriceRow]:
         sql = """
             SELECT p.id, p.hospital_id, p.procedure_id, pr.tuss_code, pr.name,
                    p.price, p.start_date, p.note, p.active
@@ -12,9 +13,9 @@ class HospitalPriceRepository:
              WHERE p.hospital_id=%s
              ORDER BY pr.name, p.start_date DESC, p.id DESC;
         """
-        with get_conn() as conn, conn.cursor() as cur:
+        with get_conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cur:
             cur.execute(sql, (hospital_id,))
-            return cur.fetchall()
+            return PriceRow.from_rows(cur)
 
     def add_price(self, data: Dict[str, Any]) -> int:
         """
@@ -66,7 +67,7 @@ class HospitalPriceRepository:
     # Suporte ao formulário médico (SEM vigência)
     # ---------------------------
 
-    def list_procedures_for_hospital(self, hospital_id: int) -> List[Dict[str, Any]]:
+    def list_procedures_for_hospital(self, hospital_id: int) -> List[ProcedurePriceRow]:
         """
         Retorna 1 linha por procedimento cadastrado para o hospital,
         pegando o PREÇO ATIVO mais recente, ignorando datas.
@@ -82,9 +83,9 @@ class HospitalPriceRepository:
              AND hpp.active = TRUE
            ORDER BY hpp.procedure_id, hpp.id DESC;   -- pega o último ativo
         """
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql, {"hid": hospital_id})
-            return cur.fetchall()
+        with get_conn() as conn, conn.cursor(cursor_factory=TupleCursor) as cur:
+            execute_prepared(cur, "hpp_procedures_for_hospital", sql, {"hid": hospital_id})
+            return ProcedurePriceRow.from_rows(cur)
 
     def resolve_price(self, hospital_id: int, procedure_id: int) -> Optional[float]:
         """
@@ -100,6 +101,6 @@ class HospitalPriceRepository:
            LIMIT 1;
         """
         with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql, {"hid": hospital_id, "pid": procedure_id})
+            execute_prepared(cur, "hpp_resolve_price", sql, {"hid": hospital_id, "pid": procedure_id})
             row = cur.fetchone()
             return row["price"] if row else None
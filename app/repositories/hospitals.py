@@ -1,6 +1,7 @@
 # app/repositories/hospitals.py
 from typing import List, Dict, Any, Optional
 from ..db import get_conn
+from .data_versions import bump as bump_version
 
 class HospitalRepository:
     def list(self, q: str = "") -> List[Dict[str, Any]]:
@@ -46,7 +47,9 @@ class HospitalRepository:
         sql = f"INSERT INTO hospitals ({','.join(cols)}) VALUES ({placeholders}) RETURNING id;"
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute(sql, data)
-            return cur.fetchone()["id"]
+            hid = cur.fetchone()["id"]
+            bump_version(cur, "registry")
+            return hid
 
     def update(self, hid: int, data: Dict[str, Any]) -> None:
         # REMOVIDO: 'cfop'
@@ -67,8 +70,12 @@ class HospitalRepository:
         sql = f"UPDATE hospitals SET {set_clause} WHERE id=%(id)s;"
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute(sql, {**data, "id": hid})
+            bump_version(cur, "registry")
 
     def delete(self, hid: int) -> bool:
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute("DELETE FROM hospitals WHERE id=%s RETURNING id;", (hid,))
-            return bool(cur.fetchone())
+            deleted = bool(cur.fetchone())
+            if deleted:
+                bump_version(cur, "registry")
+            return deleted
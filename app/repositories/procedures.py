@@ -1,5 +1,6 @@
 from typing import List, Dict, Any, Optional
 from ..db import get_conn
+from .data_versions import bump as bump_version
 
 class ProcedureRepository:
     def list(self, q: str = "", active: Optional[bool] = None) -> List[Dict[str, Any]]:
@@ -32,7 +33,9 @@ class ProcedureRepository:
         """
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute(sql, data)
-            return cur.fetchone()[0]
+            pid = cur.fetchone()[0]
+            bump_version(cur, "registry")
+            return pid
 
     def update(self, pid: int, data: Dict[str, Any]) -> None:
         sql = """
@@ -48,8 +51,12 @@ class ProcedureRepository:
         """
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute(sql, {**data, 'id': pid})
+            bump_version(cur, "registry")
 
     def delete(self, pid: int) -> bool:
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute("DELETE FROM procedures WHERE id=%s RETURNING id;", (pid,))
-            return bool(cur.fetchone())
+            deleted = bool(cur.fetchone())
+            if deleted:
+                bump_version(cur, "registry")
+            return deleted
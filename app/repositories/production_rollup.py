@@ -0,0 +1,126 @@
+# app/repositories/production_rollup.py
+from typing import Iterable, Sequence
+from psycopg2.extras import execute_values
+from ..db import get_conn
+
+# Colunas que productions precisa devolver (RETURNING) para alimentar o rollup
+ROLLUP_RETURNING = "exec_date, doctor_user_id, hospital_id, procedure_id, quantity, unit_price"
+
+
+class ProductionRollupRepository:
+    """
+    production_rollup: productions somado por (dia, médico, hospital,
+    procedimento), com quantidade, valor (quantity * unit_price) e número
+    de lançamentos. Os dashboards leem daqui, então o custo depende do
+    número de chaves distintas e não do tamanho do histórico.
+
+    Mantido na mesma transação de cada escrita em productions
+    (ProductionRepository.insert_many/delete_own e a importação do Excel)
+    via apply(cur, linhas, sign). A tabela é criada e preenchida no boot
+    (app.schema); rebuild() recalcula tudo do zero (`flask rollup rebuild`).
+    """
+
+    # year/month: colunas de calendário geradas (séries mensais sem EXTRACT
+    # por linha); filtros de período usam faixas semiabertas em exec_date
+    DDL = """
+        CREATE TABLE IF NOT EXISTS production_rollup (
+            exec_date      date          NOT NULL,
+            doctor_user_id integer       NOT NULL,
+            hospital_id    integer       NOT NULL,
+            procedure_id   integer       NOT NULL,
+            quantity       bigint        NOT NULL DEFAULT 0,
+            value          numeric(14,2) NOT NULL DEFAULT 0,
+            entries        integer       NOT NULL DEFAULT 0,
+            PRIMARY KEY (exec_date, doctor_user_id, hospital_id, procedure_id)
+        );
+        ALTER TABLE production_rollup
+            ADD COLUMN IF NOT EXISTS year smallint
+                GENERATED ALWAYS AS (EXTRACT(YEAR FROM exec_date)::smallint) STORED,
+            ADD COLUMN IF NOT EXISTS month smallint
+                GENERATED ALWAYS AS (EXTRACT(MONTH FROM exec_date)::smallint) STORED;
+        CREATE INDEX IF NOT EXISTS production_rollup_doctor_date_idx
+            ON production_rollup (doctor_user_id, exec_date) INCLUDE (month, quantity);
+    """
+
+    def apply(self, cur, rows: Iterable[Sequence], sign: int = 1) -> None:
+        """
+        Soma (sign=1) ou subtrai (sign=-1) lançamentos do rollup, no cursor
+        (e portanto na transação) de quem gravou em productions.
+        Cada linha: (exec_date, doctor_user_id, hospital_id, procedure_id,
+        quantity, unit_price), na ordem de ROLLUP_RETURNING.
+        """
+        rows = [tuple(r)[:6] for r in rows]
+        if not rows:
+            return
+        sign = 1 if sign >= 0 else -1
+        # agrupa e ordena as chaves: upserts concorrentes travam as linhas
+        # sempre na mesma ordem (sem deadlock)
+        rows.sort(key=lambda r: r[:4])
+        execute_values(
+            cur,
+            f"""
+            INSERT INTO production_rollup AS r
+                   (exec_date, doctor_user_id, hospital_id, procedure_id, quantity, value, entries)
+            SELECT d.exec_date, d.doctor_user_id, d.hospital_id, d.procedure_id,
+                   {sign} * SUM(d.quantity),
+                   {sign} * SUM(d.quantity * COALESCE(d.unit_price, 0)),
+                   {sign} * COUNT(*)
+              FROM (VALUES %s) AS d(exec_date, doctor_user_id, hospital_id,
+                                          procedure_id, quantity, unit_price)
+          GROUP BY 1, 2, 3, 4
+          ORDER BY 1, 2, 3, 4
+            ON CONFLICT (exec_date, doctor_user_id, hospital_id, procedure_id) DO UPDATE
+               SET quantity = r.quantity + EXCLUDED.quantity,
+                   value    = r.value    + EXCLUDED.value,
+                   entries  = r.entries  + EXCLUDED.entries;
+            """,
+            rows,
+            template="(%s::date, %s::int, %s::int, %s::int, %s::int, %s::numeric)",
+            page_size=1000,
+        )
+        if sign < 0:
+            execute_values(
+                cur,
+                """
+                DELETE FROM production_rollup r
+                 USING (VALUES %s) AS k(exec_date, doctor_user_id, hospital_id, procedure_id)
+                 WHERE r.exec_date = k.exec_date
+                   AND r.doctor_user_id = k.doctor_user_id
+                   AND r.hospital_id = k.hospital_id
+                   AND r.procedure_id = k.procedure_id
+                   AND r.entries <= 0;
+                """,
+                sorted({r[:4] for r in rows}),
+                template="(%s::date, %s::int, %s::int, %s::int)",
+                page_size=1000,
+            )
+
+    def backfill(self, cur) -> int:
+        """
+        Soma productions inteira no rollup (vazio), no cursor de quem chamou.
+        Bloqueia escritas em productions até o commit para o resultado ficar
+        consistente. Retorna o número de chaves.
+        """
+        cur.execute("LOCK TABLE productions IN SHARE MODE;")
+        cur.execute("""
+            INSERT INTO production_rollup
+                   (exec_date, doctor_user_id, hospital_id, procedure_id, quantity, value, entries)
+            SELECT exec_date, doctor_user_id, hospital_id, procedure_id,
+                   COALESCE(SUM(quantity), 0),
+                   COALESCE(SUM(quantity * COALESCE(unit_price, 0)), 0),
+                   COUNT(*)
+              FROM productions
+          GROUP BY 1, 2, 3, 4;
+        """)
+        return cur.rowcount
+
+    def rebuild(self) -> int:
+        """
+        Recalcula o rollup inteiro a partir de productions (reparo).
+        Retorna o número de chaves.
+        """
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(self.DDL)
+            cur.execute("LOCK TABLE productions IN SHARE MODE;")
+            cur.execute("TRUNCATE production_rollup;")
+            return self.backfill(cur)
@@ -1,40 +1,94 @@
 # app/repositories/productions.py
-from typing import List, Dict, Any, Optional
-from ..db import get_conn
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from psycopg2.extras import execute_values
+from .. import cache
+from ..db import get_conn, iter_query, copy_csv, TupleCursor
+from ..models import ProductionRow
+from ..pagination import Page, StreamedPage, Cursor, build_page, keyset_where, DEFAULT_PAGE_SIZE
+from .production_rollup import ProductionRollupRepository, ROLLUP_RETURNING
+from .data_versions import bump_after_commit
+from .doctor_summary import DoctorSummaryRepository
 
 class ProductionRepository:
+    # índices das consultas por período/médico (range scans em exec_date) e
+    # da paginação por chave (exec_date, id); CONCURRENTLY para não travar
+    # gravações (`flask db init`). (exec_date DESC, id DESC) também atende
+    # os filtros só por data: um índice só em exec_date seria redundante.
+    INDEXES = (
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS productions_date_id_idx"
+        " ON productions (exec_date DESC, id DESC)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS productions_doctor_date_idx"
+        " ON productions (doctor_user_id, exec_date DESC, id DESC)",
+    )
+
+    def __init__(self):
+        self.rollup = ProductionRollupRepository()
+        self.summaries = DoctorSummaryRepository()
+
+    def sync_aggregates(self, cur, rows, sign: int = 1) -> None:
+        """
+        Atualiza production_rollup e doctor_summary com as linhas gravadas
+        (RETURNING ROLLUP_RETURNING), no cursor/transação da escrita.
+        Depois do commit, chame after_write().
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        self.rollup.apply(cur, rows, sign=sign)
+        self.summaries.apply(cur, rows, sign=sign)
+
+    def after_write(self) -> None:
+        """
+        Depois do commit de uma escrita em productions: esvazia os caches
+        de resultados e avança a versão "productions" (ETag dos painéis).
+        """
+        cache.invalidate("productions")
+        bump_after_commit("productions")
+
+    def ensure_indexes(self) -> None:
+        with get_conn() as conn:
+            conn.autocommit = True  # CREATE INDEX CONCURRENTLY não roda em transação
+            try:
+                with conn.cursor() as cur:
+                    for ddl in self.INDEXES:
+                        cur.execute(ddl)
+            finally:
+                conn.autocommit = False
+
     def insert_many(self, rows: List[Dict[str, Any]]) -> int:
         """
         Insere múltiplos lançamentos de produção.
         Espera cada linha com:
           doctor_user_id, hospital_id, exec_date (YYYY-MM-DD),
           procedure_id, quantity, unit_price, note
+        Atualiza production_rollup e doctor_summary na mesma transação.
         """
         if not rows:
             return 0
-        sql = """
+        sql = f"""
             INSERT INTO productions
               (doctor_user_id, hospital_id, exec_date, procedure_id, quantity, unit_price, note)
-            VALUES
+            VALUES %s
+            RETURNING {ROLLUP_RETURNING}
+        """
+        template = """
               (%(doctor_user_id)s, %(hospital_id)s, %(exec_date)s::date,
                %(procedure_id)s, %(quantity)s, %(unit_price)s, NULLIF(%(note)s,''))
         """
         with get_conn() as conn, conn.cursor() as cur:
-            cur.executemany(sql, rows)
-            return cur.rowcount
+            inserted = execute_values(cur, sql, rows, template=template, fetch=True)
+            self.sync_aggregates(cur, inserted, sign=1)
+        self.after_write()
+        return len(inserted)
 
-    def list(
+    def _filters(
         self,
         doctor_user_id: Optional[int] = None,
         hospital_id: Optional[int] = None,
         date_from: Optional[str] = None,
         date_to: Optional[str] = None,
         procedure_id: Optional[int] = None,
-        limit: int = 500
-    ) -> List[Dict[str, Any]]:
-        """
-        Lista lançamentos de produção com filtros opcionais.
-        """
+    ) -> Tuple[str, Dict[str, Any]]:
         wh: list[str] = []
         params: dict[str, Any] = {}
         if doctor_user_id:
@@ -54,7 +108,10 @@ class ProductionRepository:
             params["procedure_id"] = procedure_id
 
         where = ("WHERE " + " AND ".join(wh)) if wh else ""
-        sql = f"""
+        return where, params
+
+    def _list_sql(self, where: str, order: str = "DESC") -> str:
+        return f"""
             SELECT pr.id, pr.exec_date, pr.quantity, pr.unit_price,
                    (pr.quantity * COALESCE(pr.unit_price,0))::numeric AS total,
                    pr.note,
@@ -67,13 +124,132 @@ class ProductionRepository:
               JOIN hospitals h    ON h.id = pr.hospital_id
               JOIN procedures p   ON p.id = pr.procedure_id
               {where}
-             ORDER BY pr.exec_date DESC, pr.id DESC
-             LIMIT %(limit)s;
+             ORDER BY pr.exec_date {order}, pr.id {order}
         """
-        params["limit"] = max(1, min(limit, 5000))
-        with get_conn() as conn, conn.cursor() as cur:
+
+    def page(
+        self,
+        doctor_user_id: Optional[int] = None,
+        hospital_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        procedure_id: Optional[int] = None,
+        after: Optional[Cursor] = None,
+        before: Optional[Cursor] = None,
+        per_page: int = DEFAULT_PAGE_SIZE,
+        stream: bool = False,
+        readonly: bool = True,
+    ) -> Page:
+        """
+        Uma página dos lançamentos filtrados, por chave (exec_date, id):
+        `after` = linhas depois (mais antigas) do cursor, `before` = página
+        anterior. Lê per_page+1 linhas pelo índice (exec_date DESC, id DESC),
+        então o custo não cresce com a profundidade.
+        stream=True devolve uma StreamedPage lida por cursor server-side
+        enquanto o template é enviado (só "próxima"/primeira página; a
+        anterior precisa inverter as linhas e vem como Page).
+        readonly=False lê do primário (histórico do médico logo após gravar).
+        """
+        where, params = self._filters(doctor_user_id, hospital_id, date_from, date_to, procedure_id)
+        where = keyset_where(where, params, "pr.exec_date", "pr.id", before or after,
+                             ">" if before else "<")
+
+        sql = self._list_sql(where, "ASC" if before else "DESC") + " LIMIT %(limit)s"
+        params["limit"] = per_page + 1
+        if stream and not before:
+            rows = iter_query(sql, params, itersize=min(per_page + 1, 500), readonly=readonly,
+                              row_type=ProductionRow)
+            return StreamedPage(rows, per_page, lambda r: (r.exec_date, r.id), after=bool(after))
+
+        with get_conn(readonly=readonly) as conn, conn.cursor(cursor_factory=TupleCursor) as cur:
             cur.execute(sql, params)
-            return cur.fetchall()
+            rows = ProductionRow.from_rows(cur)
+
+        if before:
+            if not rows:  # nada mais recente: volta à primeira página
+                return self.page(doctor_user_id, hospital_id, date_from, date_to, procedure_id,
+                                 per_page=per_page, stream=stream, readonly=readonly)
+            rows.reverse()
+        return build_page(rows, per_page, lambda r: (r.exec_date, r.id),
+                          after=bool(after), before=bool(before))
+
+    def totals(
+        self,
+        doctor_user_id: Optional[int] = None,
+        hospital_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        procedure_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Lançamentos, quantidade e valor dos filtros do list(), somados no
+        production_rollup (entries = nº de lançamentos): custa o mesmo que
+        um KPI do dashboard, sem contar productions linha a linha.
+        """
+        where, params = self._filters(doctor_user_id, hospital_id, date_from, date_to, procedure_id)
+        sql = f"""
+            SELECT COALESCE(SUM(pr.entries), 0)::bigint  AS entries,
+                   COALESCE(SUM(pr.quantity), 0)::bigint AS quantity,
+                   COALESCE(SUM(pr.value), 0)            AS total
+              FROM production_rollup pr
+              {where};
+        """
+        with get_conn(readonly=True) as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            return dict(cur.fetchone())
+
+    def iter_list(
+        self,
+        doctor_user_id: Optional[int] = None,
+        hospital_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        procedure_id: Optional[int] = None,
+        itersize: Optional[int] = None,
+    ) -> Iterator[ProductionRow]:
+        """
+        Mesmas linhas/filtros do list(), sem limite, lidas em lotes por um
+        cursor server-side (exportações e relatórios grandes).
+        """
+        where, params = self._filters(doctor_user_id, hospital_id, date_from, date_to, procedure_id)
+        return iter_query(
+            self._list_sql(where), params, itersize=itersize, readonly=True, row_type=ProductionRow
+        )
+
+    def copy_csv(
+        self,
+        doctor_user_id: Optional[int] = None,
+        hospital_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        procedure_id: Optional[int] = None,
+        gzip: bool = False,
+    ) -> Iterator[bytes]:
+        """
+        CSV (blocos de bytes) das linhas/filtros do list(), sem limite,
+        gerado pelo Postgres com COPY ... TO STDOUT (ver db.copy_csv):
+        colunas da planilha de exportação, datas ISO e valores com ponto.
+        """
+        where, params = self._filters(doctor_user_id, hospital_id, date_from, date_to, procedure_id)
+        sql = f"""
+            SELECT pr.exec_date                                        AS "Data",
+                   COALESCE(h.nickname, h.trade_name, h.corporate_name) AS "Hospital",
+                   COALESCE(NULLIF(d.full_name,''), u.username)         AS "Médico",
+                   p.tuss_code                                         AS "Código",
+                   p.name                                              AS "Procedimento",
+                   pr.quantity                                         AS "Quantidade",
+                   COALESCE(pr.unit_price,0)                           AS "Vlr Unit. (R$)",
+                   (pr.quantity * COALESCE(pr.unit_price,0))::numeric  AS "Total (R$)",
+                   pr.note                                             AS "Obs."
+              FROM productions pr
+              JOIN users u        ON u.id = pr.doctor_user_id
+              LEFT JOIN doctors d ON d.user_id = pr.doctor_user_id
+              JOIN hospitals h    ON h.id = pr.hospital_id
+              JOIN procedures p   ON p.id = pr.procedure_id
+              {where}
+             ORDER BY pr.exec_date DESC, pr.id DESC
+        """
+        return copy_csv(sql, params, readonly=True, gzip=gzip)
 
     def delete_own(self, prod_id: int, doctor_user_id: int) -> bool:
         """
@@ -82,7 +258,11 @@ class ProductionRepository:
         """
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute(
-                "DELETE FROM productions WHERE id=%s AND doctor_user_id=%s RETURNING id;",
+                f"DELETE FROM productions WHERE id=%s AND doctor_user_id=%s RETURNING {ROLLUP_RETURNING};",
                 (prod_id, doctor_user_id),
             )
-            return cur.fetchone() is not None
+            deleted = cur.fetchall()
+            self.sync_aggregates(cur, deleted, sign=-1)
+        if deleted:
+            self.after_write()
+        return bool(deleted)
@@ -1,6 +1,7 @@
 # app/repositories/users.py
 from typing import Optional, List, Dict, Any
-from ..db import get_conn
+from ..db import get_conn, execute_prepared
+from .data_versions import bump as bump_version
 
 class UserRepository:
     def authenticate(self, username: str, password: str) -> Optional[Dict[str, Any]]:
@@ -16,8 +17,16 @@ class UserRepository:
             return cur.fetchone()
 
     def by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        # colunas explícitas: o plano preparado fica preso ao formato do resultado
+        sql = """
+            SELECT id, username, email, role, is_active, created_at,
+                   must_change_password, privacy_accepted_at,
+                   phone, cep, street, number, complement, district, city, state
+              FROM users
+             WHERE id = %s;
+        """
         with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE id=%s;", (user_id,))
+            execute_prepared(cur, "users_by_id", sql, (user_id,))
             return cur.fetchone()
 
     def list(self) -> List[Dict[str, Any]]:
@@ -51,7 +60,9 @@ class UserRepository:
         """
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute(sql, data)
-            return cur.fetchone()["id"]
+            user_id = cur.fetchone()["id"]
+            bump_version(cur, "registry")
+            return user_id
 
     def update(self, user_id: int, fields: Dict[str, Any]) -> None:
         sql = """
@@ -73,11 +84,15 @@ class UserRepository:
         payload = {**fields, "id": user_id}
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute(sql, payload)
+            bump_version(cur, "registry")
 
     def delete(self, user_id: int) -> bool:
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute("DELETE FROM users WHERE id=%s RETURNING id;", (user_id,))
-            return bool(cur.fetchone())
+            deleted = bool(cur.fetchone())
+            if deleted:
+                bump_version(cur, "registry")
+            return deleted
 
     def reset_password(self, user_id: int, new_password: str) -> Optional[str]:
         with get_conn() as conn, conn.cursor() as cur:
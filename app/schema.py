@@ -0,0 +1,84 @@
+# app/schema.py
+"""
+Tabelas auxiliares que toda escrita em productions atualiza
+(production_rollup, doctor_summary, data_versions).
+
+ensure_schema() roda no boot de cada worker (create_app, DB_AUTO_SCHEMA) e
+no `flask db init`: cria o que faltar e, se o rollup está vazio mas
+productions não, preenche o rollup a partir dela — um deploy novo não
+quebra as gravações nem mostra dashboards zerados até alguém rodar
+`flask rollup rebuild`. Os doctor_summary são montados sob demanda
+(DoctorSummaryRepository.get).
+
+O DDL só roda quando o catálogo mostra que falta algo: ALTER TABLE e
+CREATE INDEX pegam o lock da tabela antes de olhar o IF NOT EXISTS, e no
+boot isso faria o worker esperar pelos dashboards em andamento (e travar
+tudo o que viesse depois dele).
+"""
+import logging
+
+from .db import get_conn
+from .repositories.data_versions import DataVersionRepository
+from .repositories.doctor_summary import DoctorSummaryRepository
+from .repositories.production_rollup import ProductionRollupRepository
+
+log = logging.getLogger(__name__)
+
+
+# tudo o que os DDL abaixo criam, conferido só no catálogo (sem lock de tabela)
+_READY_SQL = """
+    SELECT to_regclass('data_versions') IS NOT NULL
+       AND to_regclass('doctor_summary') IS NOT NULL
+       AND to_regclass('production_rollup') IS NOT NULL
+       AND EXISTS (SELECT 1 FROM pg_indexes
+                    WHERE schemaname = current_schema()
+                      AND indexname = 'production_rollup_doctor_date_idx')
+       AND (SELECT COUNT(*) FROM information_schema.columns
+             WHERE table_schema = current_schema()
+               AND table_name = 'production_rollup'
+               AND column_name IN ('year', 'month')) = 2 AS ready;
+"""
+
+_NEEDS_BACKFILL_SQL = """
+    SELECT NOT EXISTS (SELECT 1 FROM production_rollup)
+       AND EXISTS (SELECT 1 FROM productions) AS needs_backfill;
+"""
+
+
+def _check(cur, sql: str) -> bool:
+    cur.execute(sql)
+    return bool(cur.fetchone()[0])
+
+
+def ensure_schema() -> int:
+    """
+    Cria as tabelas auxiliares que faltam e preenche o rollup vazio.
+    Com tudo no lugar são só duas leituras baratas (catálogo e uma linha
+    de cada tabela), sem DDL nem lock. Senão um advisory lock serializa os
+    workers que sobem juntos: só o primeiro cria/preenche, os outros
+    conferem de novo e saem. Retorna quantas chaves de rollup foram criadas.
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        if _check(cur, _READY_SQL) and not _check(cur, _NEEDS_BACKFILL_SQL):
+            return 0
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('app_schema'));")
+        if not _check(cur, _READY_SQL):
+            cur.execute(DataVersionRepository.DDL)
+            cur.execute(ProductionRollupRepository.DDL)
+            cur.execute(DoctorSummaryRepository.DDL)
+        if not _check(cur, _NEEDS_BACKFILL_SQL):
+            return 0
+        n = ProductionRollupRepository().backfill(cur)
+    log.info("production_rollup preenchida a partir de productions: %d chave(s).", n)
+    return n
+
+
+def init_app(app) -> None:
+    """Garante as tabelas auxiliares no boot (já é feito em create_app())."""
+    if not app.config.get("DB_AUTO_SCHEMA", True):
+        return
+    try:
+        ensure_schema()
+    except Exception:
+        # ex.: usuário do app sem permissão de DDL; aí vale o `flask db init`
+        log.exception("Não foi possível criar/preencher as tabelas auxiliares no boot.")
@@ -1,19 +1,62 @@
 # app/services/analytics_service.py
 from typing import Any, Dict, Optional, List
-from datetime import date
+from datetime import date, timedelta
 
+from ..cache import ResultCache
 from ..repositories.analytics import AnalyticsRepository
+from ..repositories.doctor_summary import DoctorSummaryRepository
 from ..repositories.productions import ProductionRepository
 from ..repositories.hospitals import HospitalRepository
 from ..repositories.procedures import ProcedureRepository
 
 
+# baldes da série temporal, do mais fino ao mais grosso, com a duração
+# aproximada em dias (só para escolher o balde)
+SERIES_BUCKETS = (("day", 1), ("week", 7), ("month", 30.44), ("quarter", 91.31))
+SERIES_MAX_POINTS = 60
+
+# estimativa por amostragem só vale para períodos longos (ou sem início):
+# nos curtos a conta exata já é barata e a amostra seria pequena demais
+ESTIMATE_MIN_DAYS = 365
+
+# rótulos das dimensões/medidas do relatório dinâmico (ordem dos selects)
+PIVOT_LABELS = {
+    "doctor": "Médico",
+    "hospital": "Hospital",
+    "procedure": "Procedimento",
+    "month": "Mês",
+    "year": "Ano",
+}
+PIVOT_MEASURES = {"qty": "Quantidade", "value": "Valor faturado (R$)"}
+
+
+def _parse_date(v: Optional[str]) -> Optional[date]:
+    try:
+        return date.fromisoformat(v) if v else None
+    except ValueError:
+        return None
+
+
+def _series_label(bucket: str, d: date) -> str:
+    if bucket == "day":
+        return d.strftime("%d/%m/%Y")
+    if bucket == "week":
+        return "sem. " + d.strftime("%d/%m/%Y")
+    if bucket == "month":
+        return d.strftime("%m/%Y")
+    return f"T{(d.month - 1) // 3 + 1}/{d.year}"
+
+
 class AnalyticsService:
     def __init__(self):
         self.repo = AnalyticsRepository()
         self.prods = ProductionRepository()
         self.hosp = HospitalRepository()
         self.procs = ProcedureRepository()
+        self.summaries = DoctorSummaryRepository()
+        # dashboard do admin por combinação de filtros; esvaziado a cada
+        # escrita em productions (cache.invalidate("productions"))
+        self.dashboard_cache = ResultCache(tags=("productions",))
 
     # -----------------------------
     # ADMIN DASHBOARD (com filtros)
@@ -25,100 +68,220 @@ class AnalyticsService:
         hospital_id: Optional[int] = None,
         doctor_user_id: Optional[int] = None,
         procedure_id: Optional[int] = None,
+        version: Optional[str] = None,
+        estimate_rows: Optional[int] = None,
     ) -> Dict[str, Any]:
-        # KPIs "de cadastro" (sempre não filtrados)
-        t = self.repo.totals()
-
-        # KPI filtrado: soma das quantidades lançadas
-        total_proc = self.repo.total_procedures(
-            date_from, date_to, hospital_id, doctor_user_id, procedure_id
-        ) or 0
-
-        # Série mensal filtrada (ou ano corrente se sem período)
-        monthly_rows = self.repo.monthly_production(
-            date_from, date_to, hospital_id, doctor_user_id, procedure_id
-        ) or []
-        monthly: List[float] = [0.0] * 12
-        for r in monthly_rows:
-            m = int(r["m"])
-            monthly[m - 1] = float(r["qty"])
-
-        # Rótulo do gráfico
-        year_label = "período" if (date_from or date_to) else str(date.today().year)
-
-        # Rankings (filtrados)
-        top_doctors = self.repo.top_doctors(
-            limit=8,
-            date_from=date_from,
-            date_to=date_to,
-            hospital_id=hospital_id,
-            doctor_user_id=doctor_user_id,
-            procedure_id=procedure_id,
-        ) or []
-        top_hospitals = self.repo.top_hospitals(
-            limit=8,
-            date_from=date_from,
-            date_to=date_to,
-            hospital_id=hospital_id,
-            doctor_user_id=doctor_user_id,
-            procedure_id=procedure_id,
-        ) or []
+        # Uma consulta só (uma leitura do rollup) traz KPIs e rankings; o resultado fica em cache por combinação de filtros e
+        # recargas simultâneas dos mesmos filtros fazem uma consulta só.
+        # `version` (DataVersionRepository.current) entra na chave: quem
+        # já sabe a versão dos dados nunca recebe um resultado anterior a ela.
+        # `estimate_rows`: modo "estimativa rápida" — lê uma amostra de
+        # ~estimate_rows linhas do rollup (payload["approx"] traz o
+        # percentual e as margens). Só se aplica a períodos longos; nos
+        # demais (ou com tabela pequena) a resposta já é a exata.
+        estimate = bool(estimate_rows) and self._long_range(date_from, date_to)
+        key = (date_from, date_to, hospital_id, doctor_user_id, procedure_id, version,
+               estimate_rows if estimate else None)
+
+        def load() -> Dict[str, Any]:
+            # o tamanho da amostra (pg_class) só é consultado quando há
+            # consulta de verdade; acertos do cache não vão ao banco
+            sample = self.repo.sample_percent(estimate_rows) if estimate else None
+            summary = self.repo.dashboard_summary(
+                limit=8,
+                date_from=date_from,
+                date_to=date_to,
+                hospital_id=hospital_id,
+                doctor_user_id=doctor_user_id,
+                procedure_id=procedure_id,
+                sample_percent=sample,
+            )
+            return self._dashboard_payload(summary)
+
+        return self.dashboard_cache.get_or_load(key, load)
+
+    @staticmethod
+    def _long_range(date_from: Optional[str], date_to: Optional[str]) -> bool:
+        start = _parse_date(date_from)
+        if start is None:
+            return True
+        end = _parse_date(date_to) or date.today()
+        return (end - start).days >= ESTIMATE_MIN_DAYS
+
+    def _dashboard_payload(self, summary: Dict[str, Any]) -> Dict[str, Any]:
+        approx = None
+        if summary["sample_percent"] is not None:
+            # margens de ~95% (±) das estimativas; None = números exatos
+            approx = {
+                "percent": summary["sample_percent"],
+                "procedures": round(float(summary["procedures_err"])),
+                "value": round(float(summary["value_err"]), 2),
+            }
+
+        def ranking(rows) -> List[Dict[str, Any]]:
+            out = []
+            for r in rows:
+                item = {"name": r["name"], "qty": float(r["qty"]), "value": float(r["value"] or 0)}
+                if approx:
+                    item["qty_err"] = round(float(r["qty_err"]))
+                    item["value_err"] = round(float(r["value_err"]), 2)
+                out.append(item)
+            return out
 
         return {
-            "year": year_label,
+            "approx": approx,
             "totals": {
-                "hospitals": int(t["hospitals"]),
-                "doctors": int(t["doctors"]),
-                "procedures": float(total_proc),
+                "hospitals": int(summary["totals"]["hospitals"]),
+                "doctors": int(summary["totals"]["doctors"]),
+                "procedures": float(summary["procedures"] or 0),
+                "value": float(summary["value"] or 0),  # faturado (quantity * unit_price)
             },
-            "monthly": monthly,
-            "top_doctors": [
-                {"name": r["name"], "qty": float(r["qty"])} for r in top_doctors
-            ],
-            "top_hospitals": [
-                {"name": r["name"], "qty": float(r["qty"])} for r in top_hospitals
-            ],
+            "top_doctors": ranking(summary["top_doctors"]),
+            "top_hospitals": ranking(summary["top_hospitals"]),
+            "top_doctors_value": ranking(summary["top_doctors_value"]),
+            "top_hospitals_value": ranking(summary["top_hospitals_value"]),
         }
 
+    def time_series(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        hospital_id: Optional[int] = None,
+        doctor_user_id: Optional[int] = None,
+        procedure_id: Optional[int] = None,
+        version: Optional[str] = None,
+        max_points: int = SERIES_MAX_POINTS,
+    ) -> Dict[str, Any]:
+        """
+        Série de quantidade/valor do período com o balde escolhido pelo
+        tamanho do intervalo (o menor entre dia/semana/mês/trimestre que
+        caiba em `max_points` pontos) e o mesmo balde do ano anterior.
+        Sem período: ano corrente; só "de": até hoje; só "até": 1 ano antes.
+        """
+        start, end = _parse_date(date_from), _parse_date(date_to)
+        if start is None and end is None:
+            start, end = date(date.today().year, 1, 1), date(date.today().year, 12, 31)
+        elif end is None:
+            end = max(start, date.today())
+        elif start is None:
+            start = end - timedelta(days=364)
+        if start > end:
+            start, end = end, start
+        end_excl = end + timedelta(days=1)  # "até" é inclusivo
+
+        days = (end_excl - start).days
+        bucket = next(
+            (b for b, size in SERIES_BUCKETS if days / size <= max_points),
+            SERIES_BUCKETS[-1][0],
+        )
+
+        key = ("series", start, end, bucket, hospital_id, doctor_user_id, procedure_id, version)
+
+        def load() -> Dict[str, Any]:
+            rows = self.repo.time_series(
+                start, end_excl, bucket,
+                hospital_id=hospital_id,
+                doctor_user_id=doctor_user_id,
+                procedure_id=procedure_id,
+            )
+            return {
+                "bucket": bucket,
+                "date_from": start.isoformat(),
+                "date_to": end.isoformat(),
+                "labels": [_series_label(bucket, r["bucket"]) for r in rows],
+                "qty": [float(r["qty"]) for r in rows],
+                "value": [float(r["value"] or 0) for r in rows],
+                "prev_qty": [float(r["prev_qty"]) for r in rows],
+                "prev_value": [float(r["prev_value"] or 0) for r in rows],
+            }
+
+        return self.dashboard_cache.get_or_load(key, load)
+
     # -----------------------------
-    # MÉDICO – dados do dashboard
+    # RELATÓRIO DINÂMICO (pivot)
     # -----------------------------
-    def doctor_dashboard_data(self, user_id: int) -> Dict[str, Any]:
-        """Agrega tudo que o dashboard do médico precisa."""
-        yr = date.today().year
+    def pivot(
+        self,
+        rows: str,
+        cols: str,
+        measure: str = "qty",
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        hospital_id: Optional[int] = None,
+        doctor_user_id: Optional[int] = None,
+        procedure_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Matriz `rows` x `cols` da medida (qty/value) com totais por linha,
+        por coluna e geral. O banco devolve só as células não vazias (um
+        GROUP BY); aqui elas viram a grade, com zero onde não há produção.
+        """
+        if measure not in PIVOT_MEASURES:
+            raise ValueError("Medida inválida para o relatório.")
+        cells = self.repo.pivot(
+            rows, cols,
+            date_from=date_from,
+            date_to=date_to,
+            hospital_id=hospital_id,
+            doctor_user_id=doctor_user_id,
+            procedure_id=procedure_id,
+        )
 
-        # Hospitais vinculados (apelido/nome)
-        hospitals = self.repo.hospitals_for_doctor(user_id) or []
-        hospitals_count = len(hospitals)
+        def headers(prefix: str, dim: str) -> List[Dict[str, Any]]:
+            seen = {c[prefix + "_key"]: c[prefix + "_label"] or "(sem nome)" for c in cells}
+            # datas/anos na ordem natural; cadastros em ordem alfabética
+            if dim in ("month", "year"):
+                keys = sorted(seen)
+            else:
+                keys = sorted(seen, key=lambda k: seen[k].lower())
+            return [{"key": k, "label": seen[k]} for k in keys]
 
-        # Total de procedimentos (soma de quantities)
-        procedures_total = int(self.repo.doctor_procedures_total(user_id) or 0)
+        row_headers = headers("r", rows)
+        col_headers = headers("c", cols)
+        r_pos = {h["key"]: i for i, h in enumerate(row_headers)}
+        c_pos = {h["key"]: j for j, h in enumerate(col_headers)}
 
-        # Quebra por procedimento (nome + qty) — útil para listas/tabelas
-        procedures_breakdown = (
-            self.repo.doctor_procedures_breakdown(user_id, limit=30) or []
-        )
+        matrix = [[0.0] * len(col_headers) for _ in row_headers]
+        for c in cells:
+            matrix[r_pos[c["r_key"]]][c_pos[c["c_key"]]] = float(c[measure] or 0)
 
-        # Série mensal (quantidade por mês do ano atual)
-        monthly_rows = self.repo.doctor_monthly_production(user_id, yr) or []
-        monthly: List[int] = [0] * 12
-        for r in monthly_rows:
-            m = int(r["m"])
-            q = int(r["qty"])
-            if 1 <= m <= 12:
-                monthly[m - 1] = q
+        col_totals = [sum(col) for col in zip(*matrix)] if matrix else [0.0] * len(col_headers)
+        return {
+            "rows": rows,
+            "cols": cols,
+            "measure": measure,
+            "row_headers": row_headers,
+            "col_headers": col_headers,
+            "matrix": matrix,
+            "row_totals": [sum(line) for line in matrix],
+            "col_totals": col_totals,
+            "total": sum(col_totals),
+        }
 
-        # Produção recente (últimos 5 lançamentos)
-        recent = self.repo.recent_productions_for_doctor(user_id, limit=5) or []
+    def filter_options(self) -> Dict[str, Any]:
+        """Listas dos selects de filtro do dashboard ({id, name})."""
+        return self.repo.filter_options()
+
+    # -----------------------------
+    # MÉDICO – dados do dashboard
+    # -----------------------------
+    def doctor_dashboard_data(self, user_id: int) -> Dict[str, Any]:
+        """
+        Tudo que o dashboard do médico precisa, lido de uma linha só
+        (doctor_summary, mantida a cada lançamento/exclusão).
+        """
+        s = self.summaries.get(user_id) or {}
+        hospitals = s.get("hospitals") or []
+        monthly = [int(q) for q in (s.get("monthly") or [0] * 12)]
 
         return {
-            "year": yr,
+            "year": int(s.get("year") or date.today().year),
             "hospitals": hospitals,
-            "hospitals_count": hospitals_count,
-            "procedures_total": procedures_total,
-            "procedures_breakdown": procedures_breakdown,
+            "hospitals_count": len(hospitals),
+            "procedures_total": int(s.get("procedures_total") or 0),
+            "procedures_breakdown": s.get("breakdown") or [],
             "monthly": monthly,
-            "recent": recent,
+            "recent": s.get("recent") or [],
         }
 
     # ------------------------------------------------------------------
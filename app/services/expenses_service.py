@@ -7,6 +7,8 @@ from werkzeug.utils import secure_filename
 from ..repositories.expenses import ExpensesRepository
 from ..repositories.expense_files import ExpenseFilesRepository
 
+ADMIN_LIST_LIMIT = 2000  # linhas da listagem do admin (o CSV exporta todas)
+
 class ExpensesService:
     def __init__(self) -> None:
         self.repo = ExpensesRepository()
@@ -122,6 +124,27 @@ class ExpensesService:
             date_to=date_to or None,
             city_like=city_like or None,
             limit=1000,
+            readonly=False,  # o médico precisa ver o que acabou de lançar
+        )
+
+    def page_mine(
+        self,
+        doctor_user_id: int,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        city_like: Optional[str] = None,
+        after=None,
+        per_page: int = 50,
+    ):
+        """Solicitações do médico em páginas (rolagem infinita, cursor `after`)."""
+        return self.repo.page(
+            doctor_user_id=doctor_user_id,
+            date_from=date_from or None,
+            date_to=date_to or None,
+            city_like=city_like or None,
+            after=after,
+            per_page=per_page,
+            readonly=False,  # o médico precisa ver o que acabou de lançar
         )
 
     def list_all(
@@ -136,7 +159,54 @@ class ExpensesService:
             date_from=date_from or None,
             date_to=date_to or None,
             city_like=city_like or None,
-            limit=2000,
+            limit=ADMIN_LIST_LIMIT,
+        )
+
+    def iter_all(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        city_like: Optional[str] = None,
+        doctor_user_id: Optional[int] = None,
+    ):
+        """list_all() como gerador, já com os comprovantes de cada despesa."""
+        return self.repo.iter_list(
+            doctor_user_id=doctor_user_id,
+            date_from=date_from or None,
+            date_to=date_to or None,
+            city_like=city_like or None,
+            limit=ADMIN_LIST_LIMIT,
+        )
+
+    def totals_all(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        city_like: Optional[str] = None,
+        doctor_user_id: Optional[int] = None,
+    ):
+        return self.repo.totals(
+            doctor_user_id=doctor_user_id,
+            date_from=date_from or None,
+            date_to=date_to or None,
+            city_like=city_like or None,
+        )
+
+    def export_csv(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        city_like: Optional[str] = None,
+        doctor_user_id: Optional[int] = None,
+        gzip: bool = False,
+    ):
+        """Todas as despesas do filtro do list_all() em CSV (blocos de bytes)."""
+        return self.repo.copy_csv(
+            doctor_user_id=doctor_user_id,
+            date_from=date_from or None,
+            date_to=date_to or None,
+            city_like=city_like or None,
+            gzip=gzip,
         )
 
     # Exclusões
@@ -3,6 +3,7 @@ from typing import Optional, Dict, Any, List
 
 from ..repositories.hospitals import HospitalRepository
 from ..repositories.hospital_prices import HospitalPriceRepository
+from ..models import PriceRow, ProcedurePriceRow
 
 
 def _normalize_money(value: Optional[str]) -> str:
@@ -45,7 +46,7 @@ class HospitalService:
     # -----------------
     # Preços/procedures
     # -----------------
-    def list_prices(self, hospital_id: int) -> List[Dict[str, Any]]:
+    def list_prices(self, hospital_id: int) -> List[PriceRow]:
         return self.prices.list_for_hospital(hospital_id)
 
     def add_price(self, payload: Dict[str, Any]) -> int:
@@ -73,7 +74,7 @@ class HospitalService:
         self.prices.close_price(price_id, end_date)
 
     # Úteis para a tela do médico (lista de procedimentos/preço vigente)
-    def procedures_for_hospital(self, hospital_id: int) -> List[Dict[str, Any]]:
+    def procedures_for_hospital(self, hospital_id: int) -> List[ProcedurePriceRow]:
         """
         Retorna uma linha por procedimento com o preço ativo mais recente.
         """
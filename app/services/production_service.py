@@ -4,6 +4,8 @@ from datetime import datetime
 from ..repositories.productions import ProductionRepository
 from ..repositories.hospital_prices import HospitalPriceRepository
 from ..repositories.doctors import DoctorRepository
+from ..models import ProcedurePriceRow
+from ..pagination import Page, Cursor
 
 class ProductionService:
     def __init__(self):
@@ -24,7 +26,7 @@ class ProductionService:
     def allowed_hospitals(self, user_id: int) -> list[int]:
         return self.docs.list_hospital_ids(user_id)
 
-    def procedures_for(self, hospital_id: int) -> list[dict]:
+    def procedures_for(self, hospital_id: int) -> list[ProcedurePriceRow]:
         return self.prices.list_procedures_for_hospital(hospital_id)
 
     def create_batch(self, doctor_user_id: int, hospital_id: int, exec_date: str,
@@ -53,22 +55,27 @@ class ProductionService:
             })
         return self.repo.insert_many(rows)
 
-    # NOVO: histórico do próprio médico com filtros
-    def list_my(
+    # histórico do próprio médico com filtros
+    def page_my(
         self,
         doctor_user_id: int,
         hospital_id: Optional[int] = None,
         date_from: Optional[str] = None,
         date_to: Optional[str] = None,
-        procedure_id: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
-        return self.repo.list(
+        procedure_id: Optional[int] = None,
+        after: Optional[Cursor] = None,
+        per_page: int = 50,
+    ) -> Page:
+        """Histórico do médico em páginas (rolagem infinita, cursor `after`)."""
+        return self.repo.page(
             doctor_user_id=doctor_user_id,
             hospital_id=hospital_id or None,
             date_from=date_from or None,
             date_to=date_to or None,
             procedure_id=procedure_id or None,
-            limit=1000
+            after=after,
+            per_page=per_page,
+            readonly=False,  # o médico precisa ver o que acabou de lançar
         )
 
     def delete_my(self, doctor_user_id: int, prod_id: int) -> bool:
@@ -0,0 +1,40 @@
+# app/streaming.py
+from typing import Iterable
+from flask import Response, get_flashed_messages, request, stream_template
+
+
+def stream_page(template_name: str, **context) -> Response:
+    """
+    Renderiza `template_name` em partes (flask.stream_template): o navegador
+    recebe o topo da página enquanto as linhas ainda vêm do banco, e o
+    worker não monta o HTML inteiro em memória. Passe as linhas como
+    gerador (ex.: iter_query) para a memória ficar constante.
+    """
+    # a sessão é gravada antes do corpo: lê os flashes já (o template usa a
+    # cópia guardada no request), senão eles reapareceriam na próxima página
+    get_flashed_messages(with_categories=True)
+
+    resp = Response(stream_template(template_name, **context), mimetype="text/html")
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx: repassa cada parte sem esperar o fim
+    return resp
+
+
+def wants_gzip() -> bool:
+    """?gzip=1 e o cliente aceita Content-Encoding: gzip."""
+    return request.args.get("gzip") == "1" and bool(request.accept_encodings["gzip"])
+
+
+def stream_csv(chunks: Iterable[bytes], filename: str, gzip: bool = False) -> Response:
+    """
+    Resposta de download em partes (chunked) para um CSV que chega em blocos
+    de bytes (ex.: db.copy_csv). Com gzip=True os blocos já vêm comprimidos
+    e vão com Content-Encoding: gzip (o navegador salva o .csv descomprimido).
+    """
+    resp = Response(chunks, mimetype="text/csv")
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.headers["X-Accel-Buffering"] = "no"
+    resp.headers["Cache-Control"] = "no-store"
+    if gzip:
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+    return resp
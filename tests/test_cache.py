@@ -0,0 +1,192 @@
+# tests/test_cache.py
+import threading
+import time
+
+import pytest
+
+from app import cache as cache_mod
+from app.cache import ResultCache, invalidate
+
+
+class Clock:
+    """Relógio controlado no lugar do time.monotonic do módulo."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(cache_mod, "time", c)
+    return c
+
+
+def counting(value):
+    calls = []
+
+    def load():
+        calls.append(1)
+        return value
+
+    return load, calls
+
+
+def test_hit_does_not_call_loader(clock):
+    c = ResultCache(maxsize=10, ttl=60)
+    load, calls = counting("x")
+    assert c.get_or_load("k", load) == "x"
+    assert c.get_or_load("k", load) == "x"
+    assert len(calls) == 1
+    assert c.stats()["hits"] == 1 and c.stats()["misses"] == 1
+
+
+def test_entry_expires_after_ttl(clock):
+    c = ResultCache(maxsize=10, ttl=60)
+    load, calls = counting("x")
+    c.get_or_load("k", load)
+    clock.now += 59.9
+    c.get_or_load("k", load)
+    assert len(calls) == 1
+    clock.now += 0.2
+    c.get_or_load("k", load)
+    assert len(calls) == 2
+
+
+def test_ttl_zero_only_coalesces(clock):
+    c = ResultCache(maxsize=10, ttl=0)
+    load, calls = counting("x")
+    c.get_or_load("k", load)
+    c.get_or_load("k", load)
+    assert len(calls) == 2
+    assert c.stats()["size"] == 0
+
+
+def test_lru_evicts_least_recently_used(clock):
+    c = ResultCache(maxsize=2, ttl=60)
+    loads = {k: counting(k) for k in "abc"}
+    c.get_or_load("a", loads["a"][0])
+    c.get_or_load("b", loads["b"][0])
+    c.get_or_load("a", loads["a"][0])  # "a" passa a ser a mais recente
+    c.get_or_load("c", loads["c"][0])  # descarta "b"
+    assert c.stats()["size"] == 2
+    c.get_or_load("a", loads["a"][0])
+    c.get_or_load("b", loads["b"][0])
+    assert len(loads["a"][1]) == 1
+    assert len(loads["b"][1]) == 2
+
+
+def test_invalidate_clears_only_tagged_caches(clock):
+    tagged = ResultCache(maxsize=10, ttl=60, tags=("productions",))
+    other = ResultCache(maxsize=10, ttl=60, tags=("registry",))
+    load_t, calls_t = counting(1)
+    load_o, calls_o = counting(2)
+    tagged.get_or_load("k", load_t)
+    other.get_or_load("k", load_o)
+    invalidate("productions")
+    tagged.get_or_load("k", load_t)
+    other.get_or_load("k", load_o)
+    assert len(calls_t) == 2
+    assert len(calls_o) == 1
+
+
+def test_load_started_before_invalidation_is_not_stored(clock):
+    c = ResultCache(maxsize=10, ttl=60, tags=("productions",))
+    calls = []
+
+    def load():
+        calls.append(1)
+        if len(calls) == 1:
+            invalidate("productions")  # escrita no meio da consulta
+        return len(calls)
+
+    assert c.get_or_load("k", load) == 1  # quem pediu recebe o que leu...
+    assert c.get_or_load("k", load) == 2  # ...mas o próximo vai ao banco
+    assert c.get_or_load("k", load) == 2
+
+
+def test_errors_are_not_cached(clock):
+    c = ResultCache(maxsize=10, ttl=60)
+    calls = []
+
+    def load():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("banco fora")
+        return "ok"
+
+    with pytest.raises(RuntimeError):
+        c.get_or_load("k", load)
+    assert c.get_or_load("k", load) == "ok"
+
+
+def test_single_flight_coalesces_concurrent_loads():
+    c = ResultCache(maxsize=10, ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "v"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(c.get_or_load("k", load)))
+    leader.start()
+    assert started.wait(5)
+    followers = [
+        threading.Thread(target=lambda: results.append(c.get_or_load("k", load)))
+        for _ in range(5)
+    ]
+    for t in followers:
+        t.start()
+    # espera os seguidores entrarem na fila da carga em andamento
+    for _ in range(500):
+        if c.stats()["coalesced"] == 5:
+            break
+        time.sleep(0.01)
+    release.set()
+    for t in [leader, *followers]:
+        t.join(5)
+
+    assert results == ["v"] * 6
+    assert len(calls) == 1
+    assert c.stats()["coalesced"] == 5
+
+
+def test_single_flight_shares_the_leader_error():
+    c = ResultCache(maxsize=10, ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+
+    def load():
+        started.set()
+        release.wait(5)
+        raise ValueError("falhou")
+
+    errors = []
+
+    def call():
+        try:
+            c.get_or_load("k", load)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    for _ in range(500):
+        if c.stats()["coalesced"] == 1:
+            break
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(errors) == 2
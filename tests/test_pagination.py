@@ -0,0 +1,132 @@
+# tests/test_pagination.py
+from datetime import date
+
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    StreamedPage,
+    build_page,
+    decode_cursor,
+    encode_cursor,
+    keyset_where,
+    page_size,
+)
+
+
+def key(row):
+    return row["exec_date"], row["id"]
+
+
+def rows(*ids):
+    # linhas já em ordem de exibição (DESC): id maior = mais recente
+    return [{"exec_date": date(2024, 1, i), "id": i} for i in ids]
+
+
+# ---- cursor ----------------------------------------------------------------
+def test_cursor_roundtrip():
+    token = encode_cursor(date(2024, 2, 29), 12345)
+    assert decode_cursor(token) == (date(2024, 2, 29), 12345)
+
+
+def test_cursor_is_url_safe_without_padding():
+    for i in range(1, 40):
+        token = encode_cursor(date(2023, 12, 31), i)
+        assert "=" not in token
+        assert all(c.isalnum() or c in "-_" for c in token)
+        assert decode_cursor(token) == (date(2023, 12, 31), i)
+
+
+def test_decode_cursor_invalid_goes_back_to_first_page():
+    assert decode_cursor(None) is None
+    assert decode_cursor("") is None
+    assert decode_cursor("não-é-base64!") is None
+    assert decode_cursor("eHh4") is None          # "xxx": sem separador
+    assert decode_cursor("MjAyNHxhYmM") is None   # "2024|abc": data/id inválidos
+    assert decode_cursor("__8") is None           # bytes que não são UTF-8
+
+
+# ---- keyset_where ----------------------------------------------------------
+def test_keyset_where_without_cursor_keeps_where():
+    params = {"a": 1}
+    assert keyset_where("WHERE a = %(a)s", params, "p.exec_date", "p.id", None) == "WHERE a = %(a)s"
+    assert params == {"a": 1}
+
+
+def test_keyset_where_appends_to_existing_where():
+    params = {}
+    sql = keyset_where("WHERE a = 1", params, "p.exec_date", "p.id", (date(2024, 1, 5), 7))
+    assert sql == "WHERE a = 1 AND (p.exec_date, p.id) < (%(key_date)s::date, %(key_id)s)"
+    assert params == {"key_date": date(2024, 1, 5), "key_id": 7}
+
+
+def test_keyset_where_starts_where_and_honours_op():
+    params = {}
+    sql = keyset_where("", params, "e.expense_date", "e.id", (date(2024, 1, 5), 7), op=">")
+    assert sql == "WHERE (e.expense_date, e.id) > (%(key_date)s::date, %(key_id)s)"
+
+
+# ---- build_page ------------------------------------------------------------
+def test_first_page_with_more_rows():
+    page = build_page(rows(5, 4, 3), per_page=2, key=key, after=False, before=False)
+    assert [r["id"] for r in page.rows] == [5, 4]
+    assert decode_cursor(page.next_cursor) == (date(2024, 1, 4), 4)
+    assert page.prev_cursor is None
+
+
+def test_last_page_after_cursor():
+    page = build_page(rows(2, 1), per_page=2, key=key, after=True, before=False)
+    assert [r["id"] for r in page.rows] == [2, 1]
+    assert page.next_cursor is None
+    assert decode_cursor(page.prev_cursor) == (date(2024, 1, 2), 2)
+
+
+def test_previous_page_drops_the_extra_newest_row():
+    # pedido "anterior": lido em ASC, já invertido por quem chamou
+    page = build_page(rows(9, 8, 7), per_page=2, key=key, after=False, before=True)
+    assert [r["id"] for r in page.rows] == [8, 7]
+    assert decode_cursor(page.prev_cursor) == (date(2024, 1, 8), 8)
+    assert decode_cursor(page.next_cursor) == (date(2024, 1, 7), 7)
+
+
+def test_previous_page_reaching_the_start():
+    page = build_page(rows(9, 8), per_page=2, key=key, after=False, before=True)
+    assert [r["id"] for r in page.rows] == [9, 8]
+    assert page.prev_cursor is None
+    assert page.next_cursor is not None
+
+
+def test_empty_page_has_no_cursors():
+    page = build_page([], per_page=50, key=key, after=True, before=False)
+    assert page.count == 0
+    assert page.next_cursor is None and page.prev_cursor is None
+
+
+def test_page_size_only_allows_known_sizes():
+    assert page_size("200") == 200
+    assert page_size("7") == DEFAULT_PAGE_SIZE
+    assert page_size("abc") == DEFAULT_PAGE_SIZE
+    assert page_size(None) == DEFAULT_PAGE_SIZE
+
+
+# ---- StreamedPage ----------------------------------------------------------
+def test_streamed_page_reads_one_extra_row_and_closes_the_source():
+    closed = []
+
+    def source():
+        try:
+            yield from rows(6, 5, 4, 3)
+        finally:
+            closed.append(True)
+
+    page = StreamedPage(source(), per_page=2, key=key, after=True)
+    assert [r["id"] for r in page.rows] == [6, 5]
+    assert closed == [True]
+    assert page.count == 2
+    assert decode_cursor(page.next_cursor) == (date(2024, 1, 5), 5)
+    assert decode_cursor(page.prev_cursor) == (date(2024, 1, 6), 6)
+
+
+def test_streamed_last_page_has_no_next_cursor():
+    page = StreamedPage(iter(rows(2, 1)), per_page=2, key=key, after=False)
+    assert [r["id"] for r in page.rows] == [2, 1]
+    assert page.next_cursor is None
+    assert page.prev_cursor is None
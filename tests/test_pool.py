@@ -0,0 +1,254 @@
+# tests/test_pool.py
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+from psycopg2.pool import PoolError
+
+from app import db
+from app.db import BlockingConnectionPool, PoolTimeout
+
+IDLE = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+INTRANS = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.dead:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class FakeConn:
+    """O mínimo de uma conexão do psycopg2 que o pool usa."""
+
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.rollbacks = 0
+        self.created_at = self.last_used = time.monotonic()
+        self.info = type("Info", (), {"transaction_status": IDLE})()
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Troca o psycopg2.connect por FakeConn; devolve a lista das abertas."""
+    conns = []
+
+    def connect(*args, **kwargs):
+        conn = FakeConn()
+        conns.append(conn)
+        return conn
+
+    monkeypatch.setattr(db.psycopg2, "connect", connect)
+    return conns
+
+
+def make_pool(minconn=0, maxconn=2, **kwargs):
+    kwargs.setdefault("timeout", 0.2)
+    kwargs.setdefault("ping_after", None)
+    return BlockingConnectionPool(minconn, maxconn, **kwargs)
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "condição não ocorreu a tempo"
+        time.sleep(0.005)
+
+
+def test_idle_connection_is_reused(opened):
+    pool = make_pool()
+    a = pool.getconn()
+    pool.putconn(a)
+    assert pool.getconn() is a
+    assert len(opened) == 1
+
+
+def test_full_pool_times_out(opened):
+    pool = make_pool(maxconn=1, timeout=0.1)
+    pool.getconn()
+    start = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert time.monotonic() - start >= 0.1
+    stats = pool.stats()
+    assert stats["timeouts"] == 1 and stats["waiting"] == 0 and stats["in_use"] == 1
+
+
+def test_full_wait_queue_fails_fast(opened):
+    pool = make_pool(maxconn=1, timeout=5, max_waiters=0)
+    pool.getconn()
+    start = time.monotonic()
+    with pytest.raises(PoolError) as err:
+        pool.getconn()
+    assert not isinstance(err.value, PoolTimeout)
+    assert time.monotonic() - start < 1
+
+
+def test_waiter_gets_the_released_connection(opened):
+    pool = make_pool(maxconn=1, timeout=5)
+    a = pool.getconn()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.getconn()))
+    t.start()
+    wait_for(lambda: pool.stats()["waiting"] == 1)
+    pool.putconn(a)
+    t.join(5)
+    assert got == [a]
+    stats = pool.stats()
+    assert stats["wait_count"] == 1 and stats["waiting"] == 0
+
+
+def test_old_connection_is_recycled(opened):
+    pool = make_pool(max_lifetime=60)
+    a = pool.getconn()
+    pool.putconn(a)
+    a.created_at -= 120
+    b = pool.getconn()
+    assert b is not a and a.closed
+    assert pool.stats()["recycled"] == 1
+    assert pool.stats()["in_use"] == 1
+
+
+def test_dead_idle_connection_fails_ping_and_is_replaced(opened):
+    pool = make_pool(ping_after=10)
+    a = pool.getconn()
+    pool.putconn(a)
+    a.dead = True
+    a.last_used -= 60  # ociosa além do ping_after
+    b = pool.getconn()
+    assert b is not a and a.closed
+    assert pool.stats()["recycled"] == 1
+
+
+def test_putconn_rolls_back_open_transaction(opened):
+    pool = make_pool()
+    a = pool.getconn()
+    a.info.transaction_status = INTRANS
+    pool.putconn(a)
+    assert a.rollbacks == 1 and not a.closed
+    assert pool.stats()["idle"] == 1
+
+
+def test_max_idle_closes_the_surplus(opened):
+    pool = make_pool(maxconn=3, max_idle=1)
+    a, b = pool.getconn(), pool.getconn()
+    pool.putconn(a)
+    pool.putconn(b)
+    assert not a.closed and b.closed
+    assert pool.stats()["idle"] == 1
+
+
+def test_failed_connect_releases_the_reserved_slot(monkeypatch):
+    def refuse(*args, **kwargs):
+        raise psycopg2.OperationalError("connection refused")
+
+    monkeypatch.setattr(db.psycopg2, "connect", refuse)
+    pool = make_pool(maxconn=1)
+    for _ in range(3):
+        with pytest.raises(psycopg2.OperationalError):
+            pool.getconn()
+    stats = pool.stats()
+    assert stats["connecting"] == 0 and stats["in_use"] == 0
+
+
+def test_connect_happens_outside_the_pool_lock(monkeypatch):
+    slow_started = threading.Event()
+    release = threading.Event()
+
+    def connect(*args, **kwargs):
+        if threading.current_thread().name == "slow":
+            slow_started.set()
+            release.wait(5)
+        return FakeConn()
+
+    monkeypatch.setattr(db.psycopg2, "connect", connect)
+    pool = make_pool(maxconn=3, timeout=5)
+    idle = pool.getconn()
+    pool.putconn(idle)
+    busy = pool.getconn()  # leva a ociosa
+    slow = threading.Thread(target=pool.getconn, name="slow")
+    slow.start()
+    assert slow_started.wait(5)
+    # enquanto "slow" conecta, devolver e pegar conexões não espera por ele
+    start = time.monotonic()
+    pool.putconn(busy)
+    assert pool.getconn() is busy
+    assert time.monotonic() - start < 1
+    assert pool.stats()["connecting"] == 1
+    release.set()
+    slow.join(5)
+    assert pool.stats()["in_use"] == 2
+
+
+def test_reserve_is_only_for_auxiliary_checkouts(opened):
+    pool = make_pool(maxconn=3, reserve=1, timeout=0.1)
+    pool.getconn()
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    aux = pool.getconn(use_reserve=True)
+    assert aux is not None and pool.stats()["in_use"] == 3
+
+
+def test_reserve_waiter_is_woken_by_any_release(opened):
+    pool = make_pool(maxconn=2, reserve=1, timeout=5)
+    a = pool.getconn()
+    aux = pool.getconn(use_reserve=True)
+    got = []
+    normal = threading.Thread(target=lambda: got.append(("normal", pool.getconn())))
+    normal.start()
+    wait_for(lambda: pool.stats()["waiting"] == 1)
+    aux_waiter = threading.Thread(target=lambda: got.append(("aux", pool.getconn(use_reserve=True))))
+    aux_waiter.start()
+    wait_for(lambda: pool.stats()["waiting"] == 2)
+    # com 1 em uso (= maxconn - reserve) a vaga liberada só serve ao
+    # auxiliar: ele não pode perder o aviso para o comum, que volta a esperar
+    pool.putconn(aux)
+    wait_for(lambda: len(got) == 1)
+    assert got[0][0] == "aux"
+    assert pool.stats()["waiting"] == 1
+    pool.putconn(got[0][1])
+    pool.putconn(a)
+    normal.join(5)
+    aux_waiter.join(5)
+    assert [kind for kind, _ in got] == ["aux", "normal"]
+
+
+def test_maintain_replaces_dead_idle_connections_and_refills(opened):
+    pool = make_pool(minconn=2, maxconn=4)
+    assert len(opened) == 2  # o AbstractConnectionPool abre minconn no __init__
+    opened[0].dead = True
+    recycled = pool.maintain()
+    assert recycled == 1
+    assert opened[0].closed
+    stats = pool.stats()
+    assert stats["idle"] == 2 and stats["in_use"] == 0 and stats["recycled"] == 1
+
+
+def test_closed_pool_refuses_connections(opened):
+    pool = make_pool()
+    pool.closeall()
+    with pytest.raises(PoolError):
+        pool.getconn()
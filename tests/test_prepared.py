@@ -0,0 +1,84 @@
+# tests/test_prepared.py
+import psycopg2.errors
+import pytest
+
+from app import db
+from app.db import _compile_statement, execute_prepared
+
+
+def test_positional_params():
+    prepare, execute = _compile_statement("s1", "SELECT a FROM t WHERE a = %s AND b > %s;")
+    assert prepare == "PREPARE s1 AS SELECT a FROM t WHERE a = $1 AND b > $2"
+    assert execute == "EXECUTE s1 (%s, %s)"
+
+
+def test_named_params_repeat_the_same_number():
+    prepare, execute = _compile_statement(
+        "s2", "SELECT * FROM t WHERE d >= %(from)s AND d < %(to)s OR e = %(from)s"
+    )
+    assert prepare == "PREPARE s2 AS SELECT * FROM t WHERE d >= $1 AND d < $2 OR e = $1"
+    assert execute == "EXECUTE s2 (%(from)s, %(to)s)"
+
+
+def test_literal_percent_and_no_params():
+    prepare, execute = _compile_statement("s3", "  SELECT name FROM t WHERE name LIKE 'a%%'  ")
+    assert prepare == "PREPARE s3 AS SELECT name FROM t WHERE name LIKE 'a%'"
+    assert execute == "EXECUTE s3"
+
+
+def test_mixing_positional_and_named_is_rejected():
+    with pytest.raises(ValueError):
+        _compile_statement("s4", "SELECT 1 WHERE a = %s AND b = %(b)s")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.prepared = set()
+        self.prepared_stale = False
+
+
+class FakeCursor:
+    def __init__(self, fail_with=None):
+        self.connection = FakeConnection()
+        self.sent = []
+        self.fail_with = fail_with
+
+    def execute(self, sql, params=None):
+        self.sent.append((sql, params))
+        if self.fail_with and sql.startswith("EXECUTE"):
+            raise self.fail_with
+
+
+@pytest.fixture(autouse=True)
+def prepare_on(monkeypatch):
+    monkeypatch.setattr(db, "_prepare_enabled", True)
+    monkeypatch.setattr(db, "_statements", {})
+
+
+def test_prepares_once_per_connection():
+    cur = FakeCursor()
+    sql = "SELECT id FROM users WHERE id = %s;"
+    execute_prepared(cur, "users_by_id", sql, (1,))
+    execute_prepared(cur, "users_by_id", sql, (2,))
+    assert cur.sent == [
+        ("PREPARE users_by_id AS SELECT id FROM users WHERE id = $1", None),
+        ("EXECUTE users_by_id (%s)", (1,)),
+        ("EXECUTE users_by_id (%s)", (2,)),
+    ]
+    other = FakeCursor()  # outra conexão: prepara de novo
+    execute_prepared(other, "users_by_id", sql, (3,))
+    assert other.sent[0][0].startswith("PREPARE")
+
+
+def test_disabled_runs_plain_execute(monkeypatch):
+    monkeypatch.setattr(db, "_prepare_enabled", False)
+    cur = FakeCursor()
+    execute_prepared(cur, "users_by_id", "SELECT 1 WHERE %s", (1,))
+    assert cur.sent == [("SELECT 1 WHERE %s", (1,))]
+
+
+def test_invalid_plan_marks_the_connection_stale():
+    cur = FakeCursor(fail_with=psycopg2.errors.FeatureNotSupported("cached plan must not change result type"))
+    with pytest.raises(psycopg2.errors.FeatureNotSupported):
+        execute_prepared(cur, "users_by_id", "SELECT id FROM users WHERE id = %s", (1,))
+    assert cur.connection.prepared_stale is True